@@ -0,0 +1,12 @@
+# gunicorn reads this file from the directory it is started in (see Procfile)
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+
+def post_fork(server, worker):
+    # Every worker loads the model and the opening book before it takes requests,
+    # so the first engine move of a worker does not pay for them
+    from chessGame import warm_up
+    worker.log.info(f"Engine warm up: {warm_up()}")
@@ -1,3 +1,22 @@
-from .engineIntegration import Engine
+import importlib
 from .chessLogic import Board
-from .engineModel import ChessNet
\ No newline at end of file
+
+# The engine and the model pull in torch, so they are imported from their modules when first used.
+# import chessGame then only costs the board itself.
+_LAZY_NAMES = {
+    'Engine': 'engineIntegration',
+    'get_model': 'engineIntegration',
+    'get_book': 'engineIntegration',
+    'get_cache': 'engineIntegration',
+    'load_model': 'engineIntegration',
+    'warm_up': 'engineIntegration',
+    'InferenceScheduler': 'inferenceScheduler',
+    'get_scheduler': 'inferenceScheduler',
+    'BoardBatch': 'boardBatch',
+    'ChessNet': 'engineModel',
+}
+
+def __getattr__(name):
+    if name in _LAZY_NAMES:
+        return getattr(importlib.import_module('.' + _LAZY_NAMES[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,191 @@
+""""""""""""""""""
+"   BITBOARDS    "
+""""""""""""""""""
+# Squares are numbered like python-chess and the policy output of the model:
+# a1 = 0, b1 = 1, ..., h1 = 7, a2 = 8, ..., h8 = 63.
+# The board class works with (row, col) where row 0 is the 8th rank, so the
+# helpers below convert between the two.
+
+BB_EMPTY = 0
+BB_ALL = 0xFFFF_FFFF_FFFF_FFFF
+BB_SQUARES = [1 << sq for sq in range(64)]
+
+BB_FILE_A = 0x0101_0101_0101_0101
+BB_FILE_B = BB_FILE_A << 1
+BB_FILE_G = BB_FILE_A << 6
+BB_FILE_H = BB_FILE_A << 7
+
+BB_RANK_1 = 0xFF
+BB_RANK_4 = BB_RANK_1 << (8 * 3)
+BB_RANK_5 = BB_RANK_1 << (8 * 4)
+
+BB_NOT_FILE_A = BB_ALL ^ BB_FILE_A
+BB_NOT_FILE_H = BB_ALL ^ BB_FILE_H
+BB_NOT_FILE_AB = BB_ALL ^ (BB_FILE_A | BB_FILE_B)
+BB_NOT_FILE_GH = BB_ALL ^ (BB_FILE_G | BB_FILE_H)
+
+
+def square(row, col):
+    """
+    Convert (row, col) on our board to a square index (e.g., (6, 4) -> 12 for 'e2').
+    """
+    return (7 - row) * 8 + col
+
+
+def square_row_col(sq):
+    """
+    Convert a square index back to (row, col) on our board.
+    """
+    return (7 - (sq >> 3), sq & 7)
+
+
+def lsb(bb):
+    """
+    Index of the least significant set bit.
+    """
+    return (bb & -bb).bit_length() - 1
+
+
+def scan(bb):
+    """
+    Yields the square index of every set bit, lowest first.
+    """
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+# Set-wise shifts. They move every bit of the bitboard one step in a direction
+# and drop the bits that would wrap around the edge of the board.
+def shift_north(bb):
+    return (bb << 8) & BB_ALL
+
+def shift_south(bb):
+    return bb >> 8
+
+def shift_east(bb):
+    return (bb << 1) & BB_NOT_FILE_A
+
+def shift_west(bb):
+    return (bb >> 1) & BB_NOT_FILE_H
+
+def shift_north_east(bb):
+    return (bb << 9) & BB_NOT_FILE_A
+
+def shift_north_west(bb):
+    return (bb << 7) & BB_NOT_FILE_H
+
+def shift_south_east(bb):
+    return (bb >> 7) & BB_NOT_FILE_A
+
+def shift_south_west(bb):
+    return (bb >> 9) & BB_NOT_FILE_H
+
+
+# Attack generation. Every function takes a bitboard of attackers (any number
+# of pieces) and returns the union of the squares they attack.
+def knight_attacks(bb):
+    l1 = (bb >> 1) & BB_NOT_FILE_H
+    l2 = (bb >> 2) & BB_NOT_FILE_GH
+    r1 = (bb << 1) & BB_NOT_FILE_A
+    r2 = (bb << 2) & BB_NOT_FILE_AB
+    h1 = l1 | r1
+    h2 = l2 | r2
+    return ((h1 << 16) | (h1 >> 16) | (h2 << 8) | (h2 >> 8)) & BB_ALL
+
+def king_attacks(bb):
+    attacks = shift_east(bb) | shift_west(bb)
+    bb = bb | attacks  # Not |=, which would write into a numpy array passed in
+    return attacks | shift_north(bb) | shift_south(bb)
+
+def pawn_attacks(bb, color):
+    if color == 'white':
+        return shift_north_east(bb) | shift_north_west(bb)
+    return shift_south_east(bb) | shift_south_west(bb)
+
+# The sliding attacks below also work elementwise on numpy uint64 arrays (see boardBatch.py),
+# so they only use operators that do not write into their arguments and a fixed number of steps.
+def _slide(bb, empty, shift):
+    """
+    Floods the bitboard through empty squares in one direction (dumb7fill)
+    and returns the squares reached, including the first blocker.
+    """
+    flood = bb
+    for _ in range(6):
+        bb = shift(bb) & empty
+        flood = flood | bb
+    return shift(flood)
+
+def rook_attacks(bb, occupied):
+    empty = ~occupied
+    return (_slide(bb, empty, shift_north) | _slide(bb, empty, shift_south) |
+            _slide(bb, empty, shift_east) | _slide(bb, empty, shift_west))
+
+def bishop_attacks(bb, occupied):
+    empty = ~occupied
+    return (_slide(bb, empty, shift_north_east) | _slide(bb, empty, shift_north_west) |
+            _slide(bb, empty, shift_south_east) | _slide(bb, empty, shift_south_west))
+
+def _between(a, b):
+    rank_diff = (b >> 3) - (a >> 3)
+    file_diff = (b & 7) - (a & 7)
+    if a == b or not (rank_diff == 0 or file_diff == 0 or abs(rank_diff) == abs(file_diff)):
+        return BB_EMPTY
+    step = ((rank_diff > 0) - (rank_diff < 0)) * 8 + ((file_diff > 0) - (file_diff < 0))
+    bb = BB_EMPTY
+    sq = a + step
+    while sq != b:
+        bb |= BB_SQUARES[sq]
+        sq += step
+    return bb
+
+def _ray(sq, shift):
+    ray = BB_EMPTY
+    bb = shift(BB_SQUARES[sq])
+    while bb:
+        ray |= bb
+        bb = shift(bb)
+    return ray
+
+
+# Precomputed tables, indexed by square
+KNIGHT_ATTACKS = [knight_attacks(bb) for bb in BB_SQUARES]
+KING_ATTACKS = [king_attacks(bb) for bb in BB_SQUARES]
+PAWN_ATTACKS = {color: [pawn_attacks(bb, color) for bb in BB_SQUARES] for color in ('white', 'black')}
+
+# Squares strictly between two squares sharing a rank, file or diagonal, empty if they are not aligned
+BB_BETWEEN = [[_between(a, b) for b in range(64)] for a in range(64)]
+
+# Rays from a square to the edge of the board, one table per direction.
+# Rays pointing to higher square indices meet their first blocker at the lowest set bit,
+# rays pointing to lower indices at the highest one.
+ROOK_RAYS_UP = [[_ray(sq, shift) for sq in range(64)] for shift in (shift_north, shift_east)]
+ROOK_RAYS_DOWN = [[_ray(sq, shift) for sq in range(64)] for shift in (shift_south, shift_west)]
+BISHOP_RAYS_UP = [[_ray(sq, shift) for sq in range(64)] for shift in (shift_north_east, shift_north_west)]
+BISHOP_RAYS_DOWN = [[_ray(sq, shift) for sq in range(64)] for shift in (shift_south_east, shift_south_west)]
+
+def _ray_attacks(sq, occupied, rays_up, rays_down):
+    attacks = BB_EMPTY
+    for rays in rays_up:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[(blockers & -blockers).bit_length() - 1]
+        attacks |= ray
+    for rays in rays_down:
+        ray = rays[sq]
+        blockers = ray & occupied
+        if blockers:
+            ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+def rook_attacks_from(sq, occupied):
+    """
+    Squares a rook on sq attacks, up to and including the first blocker in each direction.
+    """
+    return _ray_attacks(sq, occupied, ROOK_RAYS_UP, ROOK_RAYS_DOWN)
+
+def bishop_attacks_from(sq, occupied):
+    return _ray_attacks(sq, occupied, BISHOP_RAYS_UP, BISHOP_RAYS_DOWN)
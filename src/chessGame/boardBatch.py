@@ -0,0 +1,207 @@
+""""""""""""""""""
+"  BOARD  BATCH  "
+""""""""""""""""""
+# Many positions at once as numpy arrays, for batched inference, evaluation sweeps and data generation.
+# The set-wise functions in bitboard.py work elementwise on uint64 arrays just as well as on ints,
+# so the legal moves of every position and every square are worked out in the same few array passes.
+import numpy as np
+try:
+    from .bitboard import *
+    from .bitboard import _slide
+    from .chessLogic import PIECES
+except ImportError:
+    from bitboard import *
+    from bitboard import _slide
+    from chessLogic import PIECES
+
+# Piece codes in BoardBatch.pieces: 0 for an empty square, the piece id (1-6) for white pieces
+# and the piece id + 6 for black ones, so code - 1 is the input plane of the piece in the model
+PIECE_CODES = {piece: piece.id + (6 if color == 'black' else 0)
+               for color, pieces in PIECES.items() for piece in pieces.values()}
+
+SQUARE_BITS = np.array(BB_SQUARES, dtype=np.uint64)
+_ALL = np.uint64(BB_ALL)
+_BETWEEN = np.array(BB_BETWEEN, dtype=np.uint64)
+_KNIGHT_ATTACKS = np.array(KNIGHT_ATTACKS, dtype=np.uint64)
+_KING_ATTACKS = np.array(KING_ATTACKS, dtype=np.uint64)
+_PAWN_ATTACKS = np.array([PAWN_ATTACKS['white'], PAWN_ATTACKS['black']], dtype=np.uint64)
+
+# Castling as (rights bit, white, king square, squares that must be empty, squares that must not be attacked,
+# rook square, king target square)
+_CASTLING = [
+    (1, True, 4, 0x60, 0x70, 7, 6),
+    (2, True, 4, 0x0E, 0x1C, 0, 2),
+    (4, False, 60, 0x60 << 56, 0x70 << 56, 63, 62),
+    (8, False, 60, 0x0E << 56, 0x1C << 56, 56, 58),
+]
+
+
+def _square_of(bb):
+    """
+    Square index of bitboards with a single bit set (float64 holds powers of two exactly).
+    """
+    return np.log2(np.maximum(bb, 1).astype(np.float64)).astype(np.int64)
+
+def _more_than_one(bb):
+    return (bb & (bb - np.uint64(1))) != 0
+
+def _attacks(bitboards, white, occupied):
+    """
+    Every square attacked by the pieces in bitboards (indexed by piece id), white tells whose pieces they are.
+    """
+    pawns = bitboards[1]
+    pawn = np.where(white, shift_north_east(pawns) | shift_north_west(pawns),
+                    shift_south_east(pawns) | shift_south_west(pawns))
+    return (pawn | knight_attacks(bitboards[2]) | king_attacks(bitboards[6]) |
+            bishop_attacks(bitboards[3] | bitboards[5], occupied) |
+            rook_attacks(bitboards[4] | bitboards[5], occupied))
+
+def _attackers(target, bitboards, white, occupied):
+    """
+    The pieces in bitboards attacking the target squares, looking outward from the targets like Board.attackers_of.
+    """
+    # A white pawn attacks the target from below it, a black pawn from above
+    pawn = np.where(white, shift_south_east(target) | shift_south_west(target),
+                    shift_north_east(target) | shift_north_west(target))
+    return ((pawn & bitboards[1]) |
+            (knight_attacks(target) & bitboards[2]) |
+            (king_attacks(target) & bitboards[6]) |
+            (bishop_attacks(target, occupied) & (bitboards[3] | bitboards[5])) |
+            (rook_attacks(target, occupied) & (bitboards[4] | bitboards[5])))
+
+
+class BoardBatch:
+    """
+    N positions as arrays: pieces (N, 64) with the piece codes above indexed by square (a1 = 0),
+    turn (N,) 0 for white and 1 for black to move, castling (N,) with the bits of Board.castling
+    and en_passant (N,) with the en passant square or -1.
+    """
+    def __init__(self, pieces, turn, castling, en_passant):
+        self.pieces = np.asarray(pieces, dtype=np.int8)
+        self.turn = np.asarray(turn, dtype=np.int8)
+        self.castling = np.asarray(castling, dtype=np.int8)
+        self.en_passant = np.asarray(en_passant, dtype=np.int8)
+
+    @classmethod
+    def from_boards(cls, boards):
+        pieces = [[PIECE_CODES[piece] if piece else 0 for piece in board.squares] for board in boards]
+        turn = [board.current_turn == 'black' for board in boards]
+        castling = [board.castling for board in boards]
+        en_passant = [square(*board.en_passant_target) if board.en_passant_target else -1 for board in boards]
+        return cls(np.array(pieces, dtype=np.int8).reshape(len(boards), 64), turn, castling, en_passant)
+
+    def __len__(self):
+        return len(self.pieces)
+
+    def bitboards(self):
+        """
+        (13, N) uint64, one bitboard per piece code (row 0 is unused).
+        """
+        return np.stack([np.bitwise_or.reduce(np.where(self.pieces == code, SQUARE_BITS, np.uint64(0)), axis=1)
+                         for code in range(13)])
+
+    def legal_targets(self):
+        """
+        (N, 64) uint64, for every position and from square the bitboard of squares
+        the piece there can legally move to. Zero for empty squares and the opponent's pieces.
+        """
+        white = self.turn == 0
+        n = len(self)
+        bitboards = self.bitboards()
+        # Our and their bitboards indexed by piece id, like Board.bitboards[color]
+        ours = [None] + [np.where(white, bitboards[piece_id], bitboards[piece_id + 6]) for piece_id in range(1, 7)]
+        theirs = [None] + [np.where(white, bitboards[piece_id + 6], bitboards[piece_id]) for piece_id in range(1, 7)]
+        our_occupancy = np.bitwise_or.reduce(ours[1:])
+        their_occupancy = np.bitwise_or.reduce(theirs[1:])
+        occupied = our_occupancy | their_occupancy
+        king = ours[6]
+        king_sq = _square_of(king)
+
+        # Squares the king may not step on, with the king off the board so it cannot hide behind itself
+        danger = _attacks(theirs, ~white, occupied ^ king)
+
+        # Squares a non-king move has to land on: anywhere, the checking piece or the squares in between, or none
+        checkers = _attackers(king, theirs, ~white, occupied)
+        check_mask = np.where(checkers == 0, _ALL,
+                              np.where(_more_than_one(checkers), np.uint64(0),
+                                       checkers | _BETWEEN[king_sq, _square_of(checkers)]))
+
+        # Pins: look from the king through our own pieces up to their first piece in every direction.
+        # If that is a slider moving along the direction and exactly one of our pieces is in between,
+        # that piece may only move along the ray.
+        pins = []
+        straight = theirs[4] | theirs[5]
+        diagonal = theirs[3] | theirs[5]
+        for shift, sliders in ((shift_north, straight), (shift_south, straight), (shift_east, straight),
+                               (shift_west, straight), (shift_north_east, diagonal), (shift_north_west, diagonal),
+                               (shift_south_east, diagonal), (shift_south_west, diagonal)):
+            ray = _slide(king, ~their_occupancy, shift)
+            pinned = ray & our_occupancy
+            pins.append((np.where(((ray & sliders) != 0) & ~_more_than_one(pinned), pinned, np.uint64(0)), ray))
+
+        # From here on one entry per (position, square) holding one of our pieces, instead of all 64 squares
+        pieces = self.pieces
+        piece_ids = np.where(white[:, None], np.where(pieces <= 6, pieces, 0), np.where(pieces > 6, pieces - 6, 0))
+        rows, squares = np.nonzero(piece_ids)
+        ids = piece_ids[rows, squares]
+        from_bb = SQUARE_BITS[squares]
+        occupied_at = occupied[rows]
+        moves = np.zeros(len(rows), dtype=np.uint64)
+
+        pawn = ids == 1
+        pawn_white, pawn_empty = white[rows[pawn]], ~occupied_at[pawn]
+        single = np.where(pawn_white, shift_north(from_bb[pawn]), shift_south(from_bb[pawn])) & pawn_empty
+        double = np.where(pawn_white, shift_north(single) & BB_RANK_4, shift_south(single) & BB_RANK_5) & pawn_empty
+        captures = _PAWN_ATTACKS[self.turn[rows[pawn]], squares[pawn]] & their_occupancy[rows[pawn]]
+        moves[pawn] = single | double | captures
+        knight = ids == 2
+        moves[knight] = _KNIGHT_ATTACKS[squares[knight]]
+        diagonal_mover = (ids == 3) | (ids == 5)
+        moves[diagonal_mover] = bishop_attacks(from_bb[diagonal_mover], occupied_at[diagonal_mover])
+        straight_mover = (ids == 4) | (ids == 5)
+        moves[straight_mover] |= rook_attacks(from_bb[straight_mover], occupied_at[straight_mover])
+
+        moves &= ~our_occupancy[rows] & check_mask[rows]
+        for pinned, ray in pins:
+            moves &= np.where((pinned[rows] & from_bb) != 0, ray[rows], _ALL)
+        king_mover = ids == 6
+        moves[king_mover] = _KING_ATTACKS[squares[king_mover]] & ~(our_occupancy | danger)[rows[king_mover]]
+
+        targets = np.zeros((n, 64), dtype=np.uint64)
+        targets[rows, squares] = moves
+        zero = np.uint64(0)
+
+        # En passant takes two pawns off the board at once, so every capture is checked
+        # by looking at what attacks the king once both pawns are gone, like Board.is_safe_en_passant
+        ep = self.en_passant
+        ep_bits = np.where(ep >= 0, SQUARE_BITS[np.maximum(ep, 0)], zero)
+        ep_bits &= np.where(white, np.uint64(BB_RANK_1 << 40), np.uint64(BB_RANK_1 << 16))  # 6th rank for white, 3rd for black
+        captured = np.where(white, shift_south(ep_bits), shift_north(ep_bits)) & theirs[1]
+        their_pawns = theirs[1] ^ captured
+        for shift in (shift_east, shift_west):
+            from_bb = shift(captured) & ours[1]
+            occupied_after = (occupied ^ from_bb ^ captured) | ep_bits
+            remaining = [None, their_pawns] + theirs[2:]
+            safe = (from_bb != 0) & (_attackers(king, remaining, ~white, occupied_after) == 0)
+            safe_rows = np.nonzero(safe)[0]
+            targets[safe_rows, _square_of(from_bb[safe_rows])] |= ep_bits[safe_rows]
+
+        # Castling, the squares the king crosses may not be attacked
+        for bit, castling_white, king_from, empty_mask, safe_mask, rook_sq, king_to in _CASTLING:
+            allowed = ((white == castling_white) & ((self.castling & bit) != 0) &
+                       ((king & BB_SQUARES[king_from]) != 0) &
+                       ((ours[4] & BB_SQUARES[rook_sq]) != 0) &
+                       ((occupied & empty_mask) == 0) &
+                       ((danger & safe_mask) == 0))
+            targets[allowed, king_from] |= BB_SQUARES[king_to]
+        return targets
+
+    def legal_move_masks(self):
+        """
+        (N, 4096) bool, True at from_square * 64 + to_square for every legal move,
+        the layout of the policy output of the model. Promotions share the index of the pawn move.
+        """
+        n = len(self)
+        targets = np.ascontiguousarray(self.legal_targets(), dtype='<u8')
+        bits = np.unpackbits(targets.view(np.uint8).reshape(n, 64, 8), axis=2, bitorder='little')
+        return bits.reshape(n, 4096).astype(bool)
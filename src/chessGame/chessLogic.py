@@ -1,253 +1,276 @@
 """"""""""""""""""
 "  CHESS  LOGIC  "
 """"""""""""""""""
+import re
+try:
+    from .bitboard import *
+    from .move import *
+    from .zobrist import *
+except ImportError:
+    from bitboard import *
+    from move import *
+    from zobrist import *
+
 SQUARES = [(x, y) for x in range(8) for y in range(8)]
 
+# Piece letter, from file and rank, target square and promotion of a SAN move (castling is handled apart)
+SAN_REGEX = re.compile(r"^([NBRQK])?([a-h])?([1-8])?[\-x]?([a-h][1-8])(?:=?([nbrqNBRQ]))?[+#]?[!?]*$")
+
+# Castling rights are stored as bits of a single integer
+CASTLING_BITS = {'white': {'kingside': 1, 'queenside': 2},
+                 'black': {'kingside': 4, 'queenside': 8}}
+# Rights lost when a move starts or ends on a square (a king or rook leaving home, or a rook captured there)
+CASTLING_LOSS = [0] * 64
+CASTLING_LOSS[square(7, 4)] = 1 | 2
+CASTLING_LOSS[square(7, 7)] = 1
+CASTLING_LOSS[square(7, 0)] = 2
+CASTLING_LOSS[square(0, 4)] = 4 | 8
+CASTLING_LOSS[square(0, 7)] = 4
+CASTLING_LOSS[square(0, 0)] = 8
+
 
 class Piece:
+    """
+    Pieces are immutable and the board only holds the shared instances in PIECES,
+    one per color and piece type, so placing and copying pieces does not allocate.
+    piece_type and id are class attributes, color is the only per-instance slot.
+    """
+    __slots__ = ('color',)
+    piece_type = None
+    id = 0
+
     def __init__(self, color):
-        self.color = color
+        object.__setattr__(self, 'color', color)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return f"{type(self).__name__}('{self.color}')"
+
+    # Immutable, so copies can be the piece itself
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    # Unpickles to the shared instance, not a new piece
+    def __reduce__(self):
+        return (_shared_piece, (self.color, self.piece_type))
 
     def fen_char(self):
         pass
 
-    def get_moves(self, board, row, col, not_safe):
+    def get_targets(self, board, sq, not_safe=False):
+        """
+        Bitboard of the squares the piece on square index sq can move to, castling and en passant included.
+        Unless not_safe is set, only the legal ones.
+        """
         pass
 
+    def get_moves(self, board, row, col, not_safe=False):
+        """
+        The squares the piece on (row, col) can move to, as a list of (row, col).
+        """
+        return [square_row_col(target) for target in scan(self.get_targets(board, square(row, col), not_safe))]
+
+    def legal_targets(self, board, sq, targets, not_safe):
+        """
+        Restricts a bitboard of target squares to the legal ones using the pins and checks of the position,
+        unless not_safe is set.
+        """
+        if not not_safe:
+            targets &= board.legal_mask(self, sq)
+        return targets
+
 class King(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.piece_type = 'king'
-        self.id = 6
+    __slots__ = ()
+    piece_type = 'king'
+    id = 6
 
     def fen_char(self):
         return 'K' if self.color == 'white' else 'k'
 
-    def get_moves(self, board, row, col, not_safe = False):
-        moves = []
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if i == 0 and j == 0:
-                    continue
-                new_row, new_col = row + i, col + j
-                if 0 <= new_row < 8 and 0 <= new_col < 8:
-                    piece = board.piece_at(new_row, new_col)
-                    if (not piece or piece.color != self.color) and (not_safe or board.is_safe_move(self, (row, col), (new_row, new_col))):
-                        moves.append((new_row, new_col))
+    def get_targets(self, board, sq, not_safe = False):
+        targets = self.legal_targets(board, sq, KING_ATTACKS[sq] & ~board.occupancy[self.color], not_safe)
+        row = 7 - (sq >> 3)
         
-        if board.castling_rights[self.color]['kingside']:
+        if board.castling & CASTLING_BITS[self.color]['kingside']:
             if not board.piece_at(row, 5) and not board.piece_at(row, 6):
                 rook = board.piece_at(row, 7)
                 if rook and rook.piece_type == 'rook' and rook.color == self.color:
-                    if (not_safe or not board.is_in_check(self.color) and 
-                        not board.is_under_attack(row, 4, self.color) and 
+                    if (not_safe or not board.is_under_attack(row, 4, self.color) and 
                         not board.is_under_attack(row, 5, self.color) and 
                         not board.is_under_attack(row, 6, self.color)):
-                        if (not_safe or board.is_safe_move(self, (row, col), (row, 6))):  
-                            moves.append((row, 6))
-        if board.castling_rights[self.color]['queenside']:
+                        targets |= BB_SQUARES[square(row, 6)]
+        if board.castling & CASTLING_BITS[self.color]['queenside']:
             if not board.piece_at(row, 1) and not board.piece_at(row, 2) and not board.piece_at(row, 3):
                 rook = board.piece_at(row, 0)
                 if rook and rook.piece_type == 'rook' and rook.color == self.color:
-                    if (not_safe or not board.is_in_check(self.color) and 
-                        not board.is_under_attack(row, 4, self.color) and 
+                    if (not_safe or not board.is_under_attack(row, 4, self.color) and 
                         not board.is_under_attack(row, 3, self.color) and 
                         not board.is_under_attack(row, 2, self.color)):
-                        if (not_safe or board.is_safe_move(self, (row, col), (row, 2))):  
-                            moves.append((row, 2))
-        return moves
+                        targets |= BB_SQUARES[square(row, 2)]
+        return targets
 
 class Queen(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.piece_type = 'queen'
-        self.id = 5
+    __slots__ = ()
+    piece_type = 'queen'
+    id = 5
     
     def fen_char(self):
         return 'Q' if self.color == 'white' else 'q'
 
-    def get_moves(self, board, row, col, not_safe = False):
-        moves = []
-        for i in range(-1, 2):
-            for j in range(-1, 2):
-                if i == 0 and j == 0:
-                    continue
-                new_row, new_col = row + i, col + j
-                while 0 <= new_row < 8 and 0 <= new_col < 8:
-                    piece = board.piece_at(new_row, new_col)
-                    if (not piece or piece.color != self.color):
-                        if (not_safe or board.is_safe_move(self, (row, col), (new_row, new_col))):
-                            moves.append((new_row, new_col))
-                            if piece:
-                                break
-                    else:
-                        break
-                    new_row += i
-                    new_col += j
-        return moves
+    def get_targets(self, board, sq, not_safe = False):
+        occupied = board.occupied()
+        targets = (rook_attacks_from(sq, occupied) | bishop_attacks_from(sq, occupied)) & ~board.occupancy[self.color]
+        return self.legal_targets(board, sq, targets, not_safe)
 
 class Rook(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.piece_type = 'rook'
-        self.id = 4
+    __slots__ = ()
+    piece_type = 'rook'
+    id = 4
 
     def fen_char(self):
         return 'R' if self.color == 'white' else 'r'
 
-    def get_moves(self, board, row, col, not_safe = False):
-        moves = []
-        for i in range(-1, 2, 2):
-            new_row, new_col = row + i, col
-            while 0 <= new_row < 8:
-                piece = board.piece_at(new_row, new_col)
-                if (not piece or piece.color != self.color):
-                    if (not_safe or board.is_safe_move(self, (row, col), (new_row, new_col))):
-                        moves.append((new_row, new_col))
-                        if piece:
-                            break
-                elif (piece or piece.color == self.color):
-                    break
-                new_row += i
-        for i in range(-1, 2, 2):
-            new_row, new_col = row, col + i
-            while 0 <= new_col < 8:
-                piece = board.piece_at(new_row, new_col)
-                if (not piece or piece.color != self.color):
-                    if (not_safe or board.is_safe_move(self, (row, col), (new_row, new_col))):
-                        moves.append((new_row, new_col))
-                        if piece:
-                            break
-                else:
-                    break
-                new_col += i
-        return moves
+    def get_targets(self, board, sq, not_safe = False):
+        targets = rook_attacks_from(sq, board.occupied()) & ~board.occupancy[self.color]
+        return self.legal_targets(board, sq, targets, not_safe)
 
 class Bishop(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.piece_type = 'bishop'
-        self.id = 3
+    __slots__ = ()
+    piece_type = 'bishop'
+    id = 3
 
     def fen_char(self):
         return 'B' if self.color == 'white' else 'b'
 
-    def get_moves(self, board, row, col, not_safe = False):
-        moves = []
-        for i in range(-1, 2, 2):
-            for j in range(-1, 2, 2):
-                new_row, new_col = row + i, col + j
-                while 0 <= new_row < 8 and 0 <= new_col < 8:
-                    piece = board.piece_at(new_row, new_col)
-                    if (not piece or piece.color != self.color):
-                        if (not_safe or board.is_safe_move(self, (row, col), (new_row, new_col))):
-                            moves.append((new_row, new_col))
-                            if piece:
-                                break
-                    else:
-                        break
-                    new_row += i
-                    new_col += j
-        return moves
+    def get_targets(self, board, sq, not_safe = False):
+        targets = bishop_attacks_from(sq, board.occupied()) & ~board.occupancy[self.color]
+        return self.legal_targets(board, sq, targets, not_safe)
 
 class Knight(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.piece_type = 'knight'
-        self.id = 2
+    __slots__ = ()
+    piece_type = 'knight'
+    id = 2
 
     def fen_char(self):
         return 'N' if self.color == 'white' else 'n'
 
-    def get_moves(self, board, row, col, not_safe = False):
-        moves = []
-        for i in [-2, -1, 1, 2]:
-            for j in [-2, -1, 1, 2]:
-                if abs(i) != abs(j):
-                    new_row, new_col = row + i, col + j
-                    if 0 <= new_row < 8 and 0 <= new_col < 8:
-                        piece = board.piece_at(new_row, new_col)
-                        if (not piece or piece.color != self.color) and (not_safe or board.is_safe_move(self, (row, col), (new_row, new_col))):
-                            moves.append((new_row, new_col))
-        return moves
+    def get_targets(self, board, sq, not_safe = False):
+        targets = KNIGHT_ATTACKS[sq] & ~board.occupancy[self.color]
+        return self.legal_targets(board, sq, targets, not_safe)
 
 class Pawn(Piece):
-    def __init__(self, color):
-        super().__init__(color)
-        self.piece_type = 'pawn'
-        self.id = 1
+    __slots__ = ()
+    piece_type = 'pawn'
+    id = 1
 
     def fen_char(self):
         return 'P' if self.color == 'white' else 'p'
 
-    def get_moves(self, board, row, col, not_safe = False):
-        moves = []
-        direction = -1 if self.color == 'white' else 1
-        new_row, new_col = row + direction, col
-        # Single-square advance
-        new_row, new_col = row + direction, col
-        if 0 <= new_row < 8:
-            piece = board.piece_at(new_row, new_col)
-            if (not piece) and (not_safe or board.is_safe_move(self, (row, col), (new_row, new_col))):
-                moves.append((new_row, new_col))
-
-        # Double-square advance (only from the starting row) - consider independently of the first step
-        if (row == 1 and self.color == 'black') or (row == 6 and self.color == 'white'):
-            new_row = row + 2 * direction
-            new_col = col
-            if 0 <= new_row < 8:  # Ensure the move is within bounds
-                piece = board.piece_at(new_row, new_col)
-                # Ensure the square is empty and check if the double move is valid independently
-                if (not piece) and board.piece_at(row + direction, col) is None:  # Ensure the intermediate square is empty
-                    if (not_safe or board.is_safe_move(self, (row, col), (new_row, new_col))):
-                        moves.append((new_row, new_col))
-        for i in [-1, 1]:
-            #en passant
-            if (board.en_passant_target and board.en_passant_target == (row + direction, col + i)) and (not_safe or board.is_safe_move(self, (row, col), (row + direction, col + i), True)):
-                moves.append((row + direction, col + i))
-            new_row, new_col = row + direction, col + i
-            if 0 <= new_row < 8 and 0 <= new_col < 8:
-                piece = board.piece_at(new_row, new_col)
-                if (piece and piece.color != self.color) and (not_safe or board.is_safe_move(self, (row, col), (new_row, new_col))):
-                    moves.append((new_row, new_col))
-        return moves
+    def get_targets(self, board, sq, not_safe = False):
+        bb = BB_SQUARES[sq]
+        empty = BB_ALL ^ board.occupied()
+        opponent_color = 'black' if self.color == 'white' else 'white'
+        # Single-square advance, and the double-square advance from the starting row
+        # which needs both squares in front of the pawn to be empty
+        if self.color == 'white':
+            single = shift_north(bb) & empty
+            double = shift_north(single) & empty & BB_RANK_4
+        else:
+            single = shift_south(bb) & empty
+            double = shift_south(single) & empty & BB_RANK_5
+        captures = PAWN_ATTACKS[self.color][sq] & board.occupancy[opponent_color]
+        targets = self.legal_targets(board, sq, single | double | captures, not_safe)
+
+        #en passant
+        if board.en_passant_target and board.en_passant_target[0] == (2 if self.color == 'white' else 5):
+            ep_sq = square(*board.en_passant_target)
+            if PAWN_ATTACKS[self.color][sq] & BB_SQUARES[ep_sq]:
+                if not_safe or board.is_safe_en_passant(self.color, sq, ep_sq):
+                    targets |= BB_SQUARES[ep_sq]
+        return targets
+
+# Shared piece instances, PIECES[color][piece_type]
+PIECES = {color: {piece_class.piece_type: piece_class(color) for piece_class in (Pawn, Knight, Bishop, Rook, Queen, King)}
+          for color in ('white', 'black')}
+def _shared_piece(color, piece_type):
+    return PIECES[color][piece_type]
+
+# FEN letters to piece types
+PIECE_TYPES = {'p': 'pawn', 'n': 'knight', 'b': 'bishop', 'r': 'rook', 'q': 'queen', 'k': 'king'}
+# FEN letters to shared pieces, e.g. 'N' -> PIECES['white']['knight']
+PIECES_BY_CHAR = {piece.fen_char(): piece for pieces in PIECES.values() for piece in pieces.values()}
 
 class Board:
     def __init__(self, fen=None):
-        self.board = self.create_board()
+        # Position is kept as one bitboard per color and piece id, the occupancy per color,
+        # and a flat list of the pieces indexed by square for fast piece_at lookups
+        self.squares = [None] * 64
+        self.bitboards = {'white': [BB_EMPTY] * 7, 'black': [BB_EMPTY] * 7}
+        self.occupancy = {'white': BB_EMPTY, 'black': BB_EMPTY}
+        # Set while the lists above are shared with a copy, see copy()
+        self._shared = False
+        self._check_info = None
+        # FEN of the position, built on demand. Every move goes through set_piece
+        # (or the castling_rights setter), which drops it.
+        self._fen = None
+        # Result of outcome() for the position, False until it is asked for. Dropped together with the FEN.
+        self._outcome = False
         self.current_turn = 'white'
         self.en_passant_target = None
         self.promotion = None
-        self.castling_rights = {'white': {'kingside': True, 'queenside': True},
-                                'black': {'kingside': True, 'queenside': True}}
+        self.castling = 1 | 2 | 4 | 8
+        # Plies since the last capture or pawn move, and the number of the current full move
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.move_stack = []
+        # Zobrist key of the position, updated incrementally on every change
+        self.zobrist = 0
         
         if fen:
             self.load_fen(fen)
         else:
-            self.board = self.create_board()
+            self.create_board()
     
     # Parse fen string to board state
     def load_fen(self, fen):
         parts = fen.split()
         piece_placement = parts[0]
         self.current_turn = 'white' if parts[1] == 'w' else 'black'
+        
+        # Clear the board and place the pieces from the FEN string.
+        # Fills the square list and bitboards directly instead of going through set_piece,
+        # empty squares are skipped since they are None already.
+        self.clear()
+        squares = self.squares
+        bitboards = self.bitboards
+        occupancy = self.occupancy
+        zobrist = self.zobrist
+        sq = 56  # a8, FEN starts at the 8th rank
+        for char in piece_placement:
+            if char == '/':
+                sq -= 16  # Back to the a-file one rank down
+            elif char.isdigit():
+                sq += int(char)  # Skip empty squares
+            else:
+                piece = PIECES_BY_CHAR[char]
+                squares[sq] = piece
+                bitboards[piece.color][piece.id] |= BB_SQUARES[sq]
+                occupancy[piece.color] |= BB_SQUARES[sq]
+                zobrist ^= PIECE_KEYS[piece.color][piece.id][sq]
+                sq += 1
+        self.zobrist = zobrist
+
         self.castling_rights = self.parse_castling_rights(parts[2])
         self.en_passant_target = self.parse_en_passant(parts[3]) if parts[3] != '-' else None
-        
-        # Clear the board and place the pieces from the FEN string
-        self.board = [[None for _ in range(8)] for _ in range(8)] 
-        ranks = piece_placement.split('/')
-        for rank_idx, rank in enumerate(ranks):
-            file_idx = 0
-            for char in rank:
-                if char.isdigit():
-                    file_idx += int(char)  # Skip empty squares
-                else:
-                    color = 'white' if char.isupper() else 'black'
-                    piece_type = char.lower()
-                    piece = self.create_piece(piece_type, color)
-                    self.board[rank_idx][file_idx] = piece
-                    file_idx += 1
+        self.zobrist ^= self.en_passant_key(self.en_passant_target)
+        # The move counters are optional in a FEN string
+        self.halfmove_clock = int(parts[4]) if len(parts) > 4 else 0
+        self.fullmove_number = int(parts[5]) if len(parts) > 5 else 1
 
     def parse_castling_rights(self, castling_str):
         """
@@ -286,30 +309,40 @@ class Board:
 
         return (row, col)
 
-    # Helper to create pieces from the FEN character
+    # Helper to get the shared piece for a FEN character
     def create_piece(self, piece_type, color):
-        if piece_type == 'p':
-            return Pawn(color)
-        elif piece_type == 'r':
-            return Rook(color)
-        elif piece_type == 'n':
-            return Knight(color)
-        elif piece_type == 'b':
-            return Bishop(color)
-        elif piece_type == 'q':
-            return Queen(color)
-        elif piece_type == 'k':
-            return King(color)
+        return PIECES[color].get(PIECE_TYPES.get(piece_type))
         
+    @property
+    def castling_rights(self):
+        """
+        Castling rights as a nested dict, e.g. {'white': {'kingside': True, 'queenside': False}, ...}.
+        Built from the bits in self.castling, so assign a new dict to change them.
+        """
+        return {color: {side: bool(self.castling & bit) for side, bit in sides.items()}
+                for color, sides in CASTLING_BITS.items()}
+
+    @castling_rights.setter
+    def castling_rights(self, castling_rights):
+        self.zobrist ^= CASTLING_KEYS[self.castling]
+        self._fen = None
+        self._outcome = False
+        self.castling = 0
+        for color, sides in CASTLING_BITS.items():
+            for side, bit in sides.items():
+                if castling_rights[color][side]:
+                    self.castling |= bit
+        self.zobrist ^= CASTLING_KEYS[self.castling]
+
     def get_castling_rights_fen(self):
         rights = []
-        if self.castling_rights['white']['kingside']:
+        if self.castling & 1:
             rights.append('K')
-        if self.castling_rights['white']['queenside']:
+        if self.castling & 2:
             rights.append('Q')
-        if self.castling_rights['black']['kingside']:
+        if self.castling & 4:
             rights.append('k')
-        if self.castling_rights['black']['queenside']:
+        if self.castling & 8:
             rights.append('q')
         return ''.join(rights) or '-'
 
@@ -323,11 +356,17 @@ class Board:
 
     # Generate FEN string from the current board state
     def generate_fen(self):
+        if self._fen is None:
+            self._fen = self.build_fen()
+        return self._fen
+
+    def build_fen(self):
         fen = []
-        for row in self.board:
+        for row in range(8):
             empty_squares = 0
             fen_row = ''
-            for piece in row:
+            for col in range(8):
+                piece = self.squares[square(row, col)]
                 if piece is None:
                     empty_squares += 1
                 else:
@@ -343,119 +382,153 @@ class Board:
         turn = 'w' if self.current_turn == 'white' else 'b'
         castling = self.get_castling_rights_fen()
         en_passant = self.get_en_passant_fen()
-        halfmove_clock = '0'  
-        fullmove_number = '1' # Not caring enough to implement this
-
-        return f"{piece_placement} {turn} {castling} {en_passant} {halfmove_clock} {fullmove_number}"
-
-    def algebraic_to_index(self, square):
-        """
-        Convert from algebraic notation (e.g., 'd2') to (row, col).
-        'a'-'h' -> 0-7 and '1'-'8'.
-        """
-        files = 'abcdefgh'  # Columns 'a'-'h'
-        col = files.index(square[0])  # Get column index from 'a'-'h'
-        row = int(square[1]) - 1  # Get row index 
-        return (row, col)  # Does not invert board here because it gets inverted later
+        return f"{piece_placement} {turn} {castling} {en_passant} {self.halfmove_clock} {self.fullmove_number}"
 
     def square_to_algebraic(self, row, col):
         """
         Convert (row, col) to algebraic notation (e.g., (6,3) -> 'd2').
         Inverts the row to match algebraic notation.
         """
-        files = 'abcdefgh'
-        rank = 8 - row  # Invert row for algebraic rank (1-8)
-        file = files[col]  # Get file from 'a'-'h'
-        return f"{file}{rank}"
+        return SQUARE_NAMES[square(row, col)]
 
-    def square_index_to_row_col(self, square_index):
+    def create_board(self):
         """
-        Convert square index (0-63) to (row, col).
-        Square index 0 starts at 'a8', square index 63 is 'h1'.
+        Set up a new chess board with pieces in starting positions.
+        Only called if no FEN string is provided.
         """
-        row = square_index // 8  # Integer division to get row
-        col = square_index % 8   # Modulo to get column
-        return (row, col)
+        self.clear()
+        back_rank = ['rook', 'knight', 'bishop', 'queen', 'king', 'bishop', 'knight', 'rook']
+        # Place pieces on the board 
+        for col, piece_type in enumerate(back_rank):
+            self.set_piece(square(0, col), PIECES['black'][piece_type])
+            self.set_piece(square(7, col), PIECES['white'][piece_type])
+        for i in range(8):
+            self.set_piece(square(1, i), PIECES['black']['pawn'])
+            self.set_piece(square(6, i), PIECES['white']['pawn'])
+        self.castling = 1 | 2 | 4 | 8
+        self.zobrist ^= CASTLING_KEYS[self.castling]
 
-    def parse_move(self, move):
+    def clear(self):
         """
-        Parse a Move class instance to from_square and to_square.
+        Removes every piece, castling right and en passant target.
         """
-        # Convert the move from the Move class to algebraic notation
-
-        from_row_col = self.square_index_to_row_col(move.from_square)
-        to_row_col = self.square_index_to_row_col(move.to_square)
-
-        # Convert row, col to algebraic notation
-        from_square = self.square_to_algebraic(*from_row_col)
-        to_square = self.square_to_algebraic(*to_row_col)
+        self.squares = [None] * 64
+        self.bitboards = {'white': [BB_EMPTY] * 7, 'black': [BB_EMPTY] * 7}
+        self.occupancy = {'white': BB_EMPTY, 'black': BB_EMPTY}
+        self._shared = False
+        self._check_info = None
+        self._fen = None
+        self._outcome = False
+        self.castling = 0
+        self.en_passant_target = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.move_stack = []
+        self.zobrist = TURN_KEY if self.current_turn == 'black' else 0
 
-        # Convert algebraic squares to (row, col)
-        from_pos = self.algebraic_to_index(from_square)
-        to_pos = self.algebraic_to_index(to_square)
+    def set_piece(self, sq, piece):
+        """
+        Puts a piece (or None) on a square index and keeps the bitboards in sync.
+        Returns the piece that was on the square before.
+        """
+        if self._shared:
+            self.unshare()
+        bb = BB_SQUARES[sq]
+        old_piece = self.squares[sq]
+        if old_piece:
+            self.bitboards[old_piece.color][old_piece.id] ^= bb
+            self.occupancy[old_piece.color] ^= bb
+            self.zobrist ^= PIECE_KEYS[old_piece.color][old_piece.id][sq]
+        if piece:
+            self.bitboards[piece.color][piece.id] |= bb
+            self.occupancy[piece.color] |= bb
+            self.zobrist ^= PIECE_KEYS[piece.color][piece.id][sq]
+        self.squares[sq] = piece
+        self._check_info = None
+        self._fen = None
+        self._outcome = False
+        return old_piece
+
+    def copy(self, stack=True):
+        """
+        Returns an independent board with the same position, without going through FEN.
+        The square list and bitboards are shared until one of the two boards changes them.
+        With stack=False the copy starts without the move history, so it cannot pop
+        the moves played before and does not count them for repetitions.
+        """
+        board = Board.__new__(Board)
+        board.__dict__.update(self.__dict__)
+        board.move_stack = list(self.move_stack) if stack else []
+        self._shared = board._shared = True
+        return board
 
-        return from_pos, to_pos
+    def __copy__(self):
+        return self.copy()
 
-    def create_board(self):
+    def unshare(self):
         """
-        Create a new chess board with pieces in starting positions.
-        Only called if no FEN string is provided.
+        Gives the board its own square list and bitboards before it writes to them.
         """
-        # Create an 8x8 board with pieces placed in starting positions
-        board = [[None for _ in range(8)] for _ in range(8)]
-        # Place pieces on the board 
-        board[0][0] = Rook('black')
-        board[0][7] = Rook('black')
-        board[7][7] = Rook('white')
-        board[7][0] = Rook('white')
-        board[0][1] = Knight('black')
-        board[0][6] = Knight('black')
-        board[7][1] = Knight('white')
-        board[7][6] = Knight('white')
-        board[0][2] = Bishop('black')
-        board[0][5] = Bishop('black')
-        board[7][2] = Bishop('white')
-        board[7][5] = Bishop('white')
-        board[0][3] = Queen('black')
-        board[7][3] = Queen('white')
-        board[0][4] = King('black')
-        board[7][4] = King('white')
-        for i in range(8):
-            board[1][i] = Pawn('black')
-            board[6][i] = Pawn('white')
+        self.squares = self.squares[:]
+        self.bitboards = {color: bitboards[:] for color, bitboards in self.bitboards.items()}
+        self.occupancy = dict(self.occupancy)
+        self._shared = False
 
-        return board
+    def occupied(self):
+        return self.occupancy['white'] | self.occupancy['black']
     
     def piece_at(self, row, col):
-        return self.board[row][col]
+        return self.squares[(7 - row) * 8 + col]
 
-    def move_piece(self, start_pos, end_pos, engine=None):
-        piece = self.piece_at(*start_pos)
-
-        if piece and piece.color == self.current_turn:
-            if end_pos in piece.get_moves(self, *start_pos):
-                if engine:
-                    move = (start_pos, end_pos)
-                    engine.update(move, self)
-                self.handle_special_moves(piece, start_pos, end_pos)
-                self.board[end_pos[0]][end_pos[1]] = piece
-                self.board[start_pos[0]][start_pos[1]] = None
-                self.current_turn = 'black' if self.current_turn == 'white' else 'white'
-
-                if self.is_in_check(self.current_turn):
-                    print(f"Check! {self.current_turn} is in check.")
-                    
-                    # Check for checkmate
-                    if self.is_checkmate(self.current_turn):
-                        print(f"Checkmate! {self.current_turn} loses the game.")
-                        return True  # Game over
-                elif self.is_stalemate(self.current_turn):
-                    print("Stalemate! The game is a draw.")
-                    return True
+    def move_piece(self, start_pos, end_pos, engine=None, promotion=None):
+        """
+        Plays a move given as (row, col) squares if it is legal, see play.
+        promotion is the piece type to promote to (e.g. 'queen'), without it a pawn
+        reaching the last rank waits for promotion_piece.
+        """
+        move = encode_move(square(*start_pos), square(*end_pos), PROMOTION_IDS.get(promotion, 0))
+        return self.play(move, engine)
 
-                return True
+    def play(self, move, engine=None):
+        """
+        Plays a move if it is legal and returns whether it was.
+        """
+        if self.is_legal(move):
+            if engine:
+                engine.update(move, self)
+            # Whether the game is over is left to outcome(), so playing a move stays cheap
+            self.push(move)
+            return True
         return False
 
+    def is_legal(self, move):
+        """
+        Checks a single move, e.g. one sent by a player, without generating all the moves of the piece.
+        A pawn move to the last rank is legal with or without a promotion piece, without one
+        it waits for promotion_piece like in push.
+        """
+        from_sq, to_sq, promotion = move_from_square(move), move_to_square(move), move_promotion(move)
+        piece = self.squares[from_sq]
+        color = self.current_turn
+        if not piece or piece.color != color:
+            return False
+        to_bb = BB_SQUARES[to_sq]
+        # Can the piece get there at all, ignoring checks and pins
+        if not piece.get_targets(self, from_sq, True) & to_bb:
+            return False
+        # Only a pawn reaching the last rank can promote, and only to a knight, bishop, rook or queen
+        if promotion and (promotion not in PROMOTION_TYPES or not (piece.piece_type == 'pawn' and to_sq >> 3 in (0, 7))):
+            return False
+
+        if piece.piece_type == 'king':
+            if abs(from_sq - to_sq) == 2:
+                return bool(piece.get_targets(self, from_sq) & to_bb)  # Castling, the king checks the squares it crosses
+            opponent_color = 'black' if color == 'white' else 'white'
+            return not self.attackers_of(to_sq, opponent_color, self.occupied() ^ BB_SQUARES[from_sq])
+        if piece.piece_type == 'pawn' and self.en_passant_target and to_sq == square(*self.en_passant_target):
+            return self.is_safe_en_passant(color, from_sq, to_sq)
+        return bool(self.legal_mask(piece, from_sq) & to_bb)
+
     def is_valid_move(self, start_pos, end_pos):
         # TODO: Implement functionality for forced moves (eg. checks)
         piece = self.piece_at(*start_pos)
@@ -465,72 +538,155 @@ class Board:
     
     def promotion_piece(self, piece):
         if self.promotion:
-            if piece == 'queen':
-                piece = Queen(self.piece_at(*self.promotion).color)
-            elif piece == 'rook':
-                piece = Rook(self.piece_at(*self.promotion).color)
-            elif piece == 'bishop':
-                piece = Bishop(self.piece_at(*self.promotion).color)
-            elif piece == 'knight':
-                piece = Knight(self.piece_at(*self.promotion).color)
-            self.board[self.promotion[0]][self.promotion[1]] = piece
+            if piece in ('queen', 'rook', 'bishop', 'knight'):
+                piece = PIECES[self.piece_at(*self.promotion).color][piece]
+            self.set_piece(square(*self.promotion), piece)
             self.promotion = None
 
-    def handle_special_moves(self, piece, start_pos, end_pos):
-        #print(end_pos)
-        # takes with en passant
-        if piece.piece_type == 'pawn' and end_pos == self.en_passant_target:
-            self.board[start_pos[0]][end_pos[1]] = None
-        # Handle en passant
-        if piece.piece_type == 'pawn' and abs(start_pos[0] - end_pos[0]) == 2:
-            self.en_passant_target = ((start_pos[0] + end_pos[0]) // 2, start_pos[1])
+    def handle_special_moves(self, piece, start_sq, end_sq):
+        self.zobrist ^= self.en_passant_key(self.en_passant_target) ^ CASTLING_KEYS[self.castling]
+        if piece.piece_type == 'pawn':
+            # takes with en passant, the captured pawn is next to the start square
+            if self.en_passant_target and end_sq == square(*self.en_passant_target):
+                self.set_piece((start_sq & ~7) | (end_sq & 7), None)
+            # Handle en passant
+            if abs(start_sq - end_sq) == 16:
+                self.en_passant_target = square_row_col((start_sq + end_sq) // 2)
+            else:
+                self.en_passant_target = None
+            # Promotion
+            if end_sq >> 3 in (0, 7):
+                self.promotion = square_row_col(end_sq)
         else:
             self.en_passant_target = None
-        # Promotion
-        if piece.piece_type == 'pawn' and (end_pos[0] == 0 or end_pos[0] == 7):
-            self.promotion = end_pos
         # Handle castling
-        if piece.piece_type == 'king' and abs(start_pos[1] - end_pos[1]) == 2:
-            if end_pos[1] == 6:
-                self.board[end_pos[0]][5] = self.board[end_pos[0]][7]
-                self.board[end_pos[0]][7] = None
-            elif end_pos[1] == 2:
-                self.board[end_pos[0]][3] = self.board[end_pos[0]][0]
-                self.board[end_pos[0]][0] = None
+        if piece.piece_type == 'king' and abs(start_sq - end_sq) == 2:
+            if end_sq & 7 == 6:
+                self.set_piece(end_sq - 1, self.set_piece(end_sq + 1, None))
+            elif end_sq & 7 == 2:
+                self.set_piece(end_sq + 1, self.set_piece(end_sq - 2, None))
         # Update castling rights
-        if piece.piece_type == 'rook' and start_pos[1] == 0:
-            self.castling_rights[piece.color]['queenside'] = False
-        elif piece.piece_type == 'rook' and start_pos[1] == 7:
-            self.castling_rights[piece.color]['kingside'] = False
-        elif piece.piece_type == 'king':
-            self.castling_rights[piece.color]['kingside'] = False
-            self.castling_rights[piece.color]['queenside'] = False
+        self.castling &= ~(CASTLING_LOSS[start_sq] | CASTLING_LOSS[end_sq])
+        self.zobrist ^= self.en_passant_key(self.en_passant_target) ^ CASTLING_KEYS[self.castling]
+
+    def en_passant_key(self, en_passant_target):
+        """
+        Zobrist key for an en passant target. Like Polyglot, the file only counts when a pawn
+        is actually next to the pushed pawn, so positions that only differ by an unusable
+        en passant target share a key.
+        """
+        if not en_passant_target:
+            return 0
+        ep_sq = square(*en_passant_target)
+        # A target on row 5 was left by a white pawn, so black pawns may capture it and vice versa
+        if en_passant_target[0] == 5:
+            capturers = PAWN_ATTACKS['white'][ep_sq] & self.bitboards['black'][1]
+        else:
+            capturers = PAWN_ATTACKS['black'][ep_sq] & self.bitboards['white'][1]
+        return EN_PASSANT_KEYS[ep_sq & 7] if capturers else 0
+
+    def zobrist_hash(self):
+        """
+        Computes the Zobrist key from scratch. self.zobrist should always be equal to it.
+        """
+        key = CASTLING_KEYS[self.castling] ^ self.en_passant_key(self.en_passant_target)
+        if self.current_turn == 'black':
+            key ^= TURN_KEY
+        for sq, piece in enumerate(self.squares):
+            if piece:
+                key ^= PIECE_KEYS[piece.color][piece.id][sq]
+        return key
+
+    def push(self, move):
+        """
+        Plays a move (see move.py) without checking that it is legal.
+        Without a promotion piece a pawn reaching the last rank waits for promotion_piece, like in move_piece.
+        The move can be taken back with pop.
+        """
+        start_sq, end_sq = move_from_square(move), move_to_square(move)
+        piece = self.squares[start_sq]
+        captured = self.squares[end_sq]
+        if piece.piece_type == 'pawn' and self.en_passant_target and end_sq == square(*self.en_passant_target):
+            captured = self.squares[(start_sq & ~7) | (end_sq & 7)]
+        # Undo record, everything pop needs that it cannot work out from the move itself
+        self.move_stack.append((move, piece, captured, self.castling, self.en_passant_target, self.promotion,
+                                self.halfmove_clock, self.fullmove_number, self.zobrist))
+        if piece.piece_type == 'pawn' or captured:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if piece.color == 'black':
+            self.fullmove_number += 1
+
+        self.handle_special_moves(piece, start_sq, end_sq)
+        self.set_piece(end_sq, piece)
+        self.set_piece(start_sq, None)
+        self.current_turn = 'black' if self.current_turn == 'white' else 'white'
+        self.zobrist ^= TURN_KEY
+        promotion = move_promotion(move)
+        if promotion:
+            self.promotion_piece(PROMOTION_TYPES[promotion])
+
+    def pop(self):
+        """
+        Takes back the last move played with push (or move_piece) and returns it.
+        """
+        (move, piece, captured, castling, en_passant_target, promotion,
+         halfmove_clock, fullmove_number, zobrist) = self.move_stack.pop()
+        start_sq, end_sq = move_from_square(move), move_to_square(move)
+        self.set_piece(end_sq, None)
+        self.set_piece(start_sq, piece)
+        if piece.piece_type == 'pawn' and en_passant_target and end_sq == square(*en_passant_target):
+            self.set_piece((start_sq & ~7) | (end_sq & 7), captured)
+        else:
+            self.set_piece(end_sq, captured)
+        if piece.piece_type == 'king' and abs(start_sq - end_sq) == 2:
+            if end_sq & 7 == 6:
+                self.set_piece(end_sq + 1, self.set_piece(end_sq - 1, None))
+            elif end_sq & 7 == 2:
+                self.set_piece(end_sq - 2, self.set_piece(end_sq + 1, None))
+        self.castling = castling
+        self.en_passant_target = en_passant_target
+        self.promotion = promotion
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+        self.current_turn = piece.color
+        self.zobrist = zobrist
+        return move
 
 
     # Handle check
+    def attackers_of(self, sq, color, occupied=None):
+        """
+        Returns a bitboard of the pieces of the given color attacking a square index.
+        Looks outward from the square with the attack tables instead of generating the attacker's moves,
+        since a knight (or pawn, king, slider) attacks sq exactly when one on sq would attack it back.
+        """
+        bitboards = self.bitboards[color]
+        if occupied is None:
+            occupied = self.occupied()
+        defender_color = 'black' if color == 'white' else 'white'
+        return ((KNIGHT_ATTACKS[sq] & bitboards[2]) |
+                (KING_ATTACKS[sq] & bitboards[6]) |
+                (PAWN_ATTACKS[defender_color][sq] & bitboards[1]) |
+                (bishop_attacks_from(sq, occupied) & (bitboards[3] | bitboards[5])) |
+                (rook_attacks_from(sq, occupied) & (bitboards[4] | bitboards[5])))
+
     def is_under_attack(self, row, col, color):
-        # TODO: Re-check thisfunction
         opponent_color = 'black' if color == 'white' else 'white'
-        for r in range(8):
-            for c in range(8):
-                piece = self.piece_at(r, c)
-                if piece and piece.color == opponent_color:
-                    if (row, col) in piece.get_moves(self, r, c, True):
-                        return True
-        return False
+        return bool(self.attackers_of(square(row, col), opponent_color))
 
     def find_king(self, color):
-        for r in range(8):
-            for c in range(8):
-                piece = self.piece_at(r, c)
-                if piece and piece.piece_type == 'king' and piece.color == color:
-                    return (r, c)
+        king = self.bitboards[color][6]
+        if king:
+            return square_row_col(lsb(king))
         return None
 
     def is_in_check(self, color):
-        king_pos = self.find_king(color)
-        if king_pos:
-            return self.is_under_attack(*king_pos, color)
+        king = self.bitboards[color][6]
+        if king:
+            opponent_color = 'black' if color == 'white' else 'white'
+            return bool(self.attackers_of(lsb(king), opponent_color))
         return False
     
     def is_checkmate(self, color):
@@ -541,31 +697,8 @@ class Board:
         if not self.is_in_check(color):
             return False
 
-        # Check all pieces of the current player
-        for row in range(8):
-            for col in range(8):
-                piece = self.piece_at(row, col)
-                if piece and piece.color == color:
-                    # Get all possible moves for the piece
-                    possible_moves = piece.get_moves(self, row, col, True)
-                    for move in possible_moves:
-                        # Make a hypothetical move and check if it resolves the check
-                        original_piece = self.piece_at(*move)
-                        self.board[move[0]][move[1]] = piece
-                        self.board[row][col] = None
-
-                        if not self.is_in_check(color):
-                            # Undo the move
-                            self.board[row][col] = piece
-                            self.board[move[0]][move[1]] = original_piece
-                            return False  # There's at least one valid move, so no checkmate
-
-                        # Undo the move
-                        self.board[row][col] = piece
-                        self.board[move[0]][move[1]] = original_piece
-
         # No valid moves found, it's checkmate
-        return True
+        return not self.has_valid_move(color)
     
     def is_stalemate(self, color):
         """
@@ -577,58 +710,228 @@ class Board:
             return False
 
         # Step 2: Check if the player has any legal moves
-        for row in range(8):
-            for col in range(8):
-                piece = self.piece_at(row, col)
-                if piece and piece.color == color:
-                    possible_moves = piece.get_moves(self, row, col, True)
-                    for move in possible_moves:
-                        # Simulate the move to see if it leaves the King in check
-                        original_piece = self.piece_at(*move)
-                        self.board[move[0]][move[1]] = piece
-                        self.board[row][col] = None
-
-                        if not self.is_in_check(color):
-                            # Undo the move
-                            self.board[row][col] = piece
-                            self.board[move[0]][move[1]] = original_piece
-                            return False  # The player has at least one valid move
-
-                        # Undo the move
-                        self.board[row][col] = piece
-                        self.board[move[0]][move[1]] = original_piece
-
-        # If no valid moves are found and the player is not in check, it's stalemate
-        return True
-        
-    def is_safe_move(self, piece, start_pos, end_pos, en_passant=False):
+        return not self.has_valid_move(color)
+
+    def outcome(self):
         """
-        Simulates a move and checks if it leaves the player's king in check.
+        How the game has ended, as (termination, winner) with winner None for a draw, or None while it goes on.
+        termination is 'checkmate', 'stalemate', 'fifty_moves' or 'threefold_repetition'.
+        Worked out when first asked for and kept until the position changes.
         """
-        original_piece = self.piece_at(*end_pos)
-        self.board[end_pos[0]][end_pos[1]] = piece  # Make the move
-        self.board[start_pos[0]][start_pos[1]] = None
-        tmp_piece = None  # Track en passant captures
+        if self._outcome is False:
+            self._outcome = self.compute_outcome()
+        return self._outcome
+
+    def compute_outcome(self):
+        color = self.current_turn
+        if not self.has_valid_move(color):
+            if self.is_in_check(color):
+                return ('checkmate', 'black' if color == 'white' else 'white')
+            return ('stalemate', None)
+        if self.halfmove_clock >= 100:
+            return ('fifty_moves', None)
+        if self.repetitions() >= 3:
+            return ('threefold_repetition', None)
+        return None
 
-        # Handle en passant captures
-        if en_passant and self.en_passant_target:
-            tmp_piece = self.piece_at(start_pos[0], end_pos[1])
-            self.board[start_pos[0]][end_pos[1]] = None
+    def repetitions(self):
+        """
+        How often the current position has occurred, counting only the moves played on this board.
+        A capture or pawn move cannot be undone, so the search stops at the last one.
+        The Zobrist key covers the side to move, castling rights and en passant, so equal keys are equal positions.
+        """
+        count = 1
+        for record in self.move_stack[len(self.move_stack) - min(self.halfmove_clock, len(self.move_stack)):]:
+            if record[-1] == self.zobrist:
+                count += 1
+        return count
+
+    def has_valid_move(self, color):
+        for sq in scan(self.occupancy[color]):
+            if self.squares[sq].get_targets(self, sq):
+                return True
+        return False
 
-        is_safe = not self.is_in_check(piece.color)  # Check if king is safe
-        
+    def legal_moves(self):
+        """
+        All legal moves for the side to move, as move ints (see move.py) with their flags set.
+        A promoting pawn move comes once per piece to promote to.
+        """
+        moves = []
+        color = self.current_turn
+        theirs = self.occupancy['black' if color == 'white' else 'white']
+        ep_sq = square(*self.en_passant_target) if self.en_passant_target else None
+        for sq in scan(self.occupancy[color]):
+            piece = self.squares[sq]
+            for target in scan(piece.get_targets(self, sq)):
+                move = (sq << 6) | target
+                if BB_SQUARES[target] & theirs:
+                    move |= FLAG_CAPTURE
+                if piece.piece_type == 'pawn':
+                    if target == ep_sq:
+                        move |= FLAG_CAPTURE | FLAG_EN_PASSANT
+                    elif abs(target - sq) == 16:
+                        move |= FLAG_DOUBLE_PUSH
+                    elif target >> 3 in (0, 7):
+                        for promotion in (5, 4, 3, 2):
+                            moves.append(move | (promotion << PROMOTION_SHIFT))
+                        continue
+                elif piece.piece_type == 'king' and abs(target - sq) == 2:
+                    move |= FLAG_CASTLING
+                moves.append(move)
+        return moves
 
-        # Undo the move
-        self.board[start_pos[0]][start_pos[1]] = piece
-        self.board[end_pos[0]][end_pos[1]] = original_piece
+    def san(self, move):
+        """
+        Standard algebraic notation of a legal move in the current position, e.g. 'Nbd7', 'exd6', 'e8=Q+' or 'O-O#'.
+        """
+        from_sq, to_sq, promotion = move_from_square(move), move_to_square(move), move_promotion(move)
+        piece = self.squares[from_sq]
 
-        if en_passant and self.en_passant_target:
-            print(self.en_passant_target)
-            print("EN PASSANT")
-            print(start_pos[0], end_pos[1])
-            print(tmp_piece)
-            print(is_safe)
-            print(self.generate_fen())
-            self.board[start_pos[0]][end_pos[1]] = tmp_piece
+        if piece.piece_type == 'king' and abs(from_sq - to_sq) == 2:
+            san = 'O-O' if to_sq & 7 == 6 else 'O-O-O'
+        else:
+            capture = self.squares[to_sq] is not None
+            if piece.piece_type == 'pawn':
+                capture = capture or bool(self.en_passant_target) and to_sq == square(*self.en_passant_target)
+                san = SQUARE_NAMES[from_sq][0] if capture else ''
+            else:
+                san = piece.fen_char().upper()
+                # Other pieces of the same kind that can also reach the target square
+                others = [sq for sq in scan(self.bitboards[piece.color][piece.id] ^ BB_SQUARES[from_sq])
+                          if piece.get_targets(self, sq) & BB_SQUARES[to_sq]]
+                if others:
+                    if all(sq & 7 != from_sq & 7 for sq in others):
+                        san += SQUARE_NAMES[from_sq][0]  # The file tells them apart
+                    elif all(sq >> 3 != from_sq >> 3 for sq in others):
+                        san += SQUARE_NAMES[from_sq][1]  # The rank does
+                    else:
+                        san += SQUARE_NAMES[from_sq]
+            if capture:
+                san += 'x'
+            san += SQUARE_NAMES[to_sq]
+            if promotion:
+                san += '=' + PROMOTION_CHARS[promotion].upper()
+
+        # Check and mate suffix
+        self.push(move)
+        if self.is_in_check(self.current_turn):
+            san += '#' if not self.has_valid_move(self.current_turn) else '+'
+        self.pop()
+        return san
+
+    def parse_san(self, san):
+        """
+        Finds the legal move a SAN string stands for. Raises ValueError if there is none or it is ambiguous.
+        """
+        san = san.strip()
+        castling = san.rstrip('+#!?').replace('0', 'O')
+        if castling in ('O-O', 'O-O-O'):
+            king = self.bitboards[self.current_turn][6]
+            if king:
+                king_sq = lsb(king)
+                target = king_sq + 2 if castling == 'O-O' else king_sq - 2
+                for move in self.legal_moves():
+                    if move & FLAG_CASTLING and move_to_square(move) == target:
+                        return move & MOVE_MASK
+            raise ValueError(f"Illegal san: {san!r} in {self.generate_fen()}")
+
+        match = SAN_REGEX.match(san)
+        if not match:
+            raise ValueError(f"Invalid san: {san!r}")
+        piece_char, from_file, from_rank, to_name, promotion_char = match.groups()
+        piece_type = PIECE_TYPES[piece_char.lower()] if piece_char else 'pawn'
+        to_sq = SQUARES_BY_NAME[to_name]
+        promotion = PROMOTION_IDS_BY_CHAR[promotion_char.lower()] if promotion_char else 0
+
+        # Only the pieces of the named kind can play it, so test just those instead of generating every move
+        found = None
+        for from_sq in scan(self.bitboards[self.current_turn][PIECES[self.current_turn][piece_type].id]):
+            if from_file and SQUARE_NAMES[from_sq][0] != from_file:
+                continue
+            if from_rank and SQUARE_NAMES[from_sq][1] != from_rank:
+                continue
+            if piece_type == 'king' and abs(from_sq - to_sq) == 2:
+                continue  # Castling is written O-O
+            if piece_type == 'pawn' and not promotion and to_sq >> 3 in (0, 7):
+                continue  # A pawn reaching the last rank has to say what it promotes to
+            move = encode_move(from_sq, to_sq, promotion)
+            if not self.is_legal(move):
+                continue
+            if found is not None:
+                raise ValueError(f"Ambiguous san: {san!r} in {self.generate_fen()}")
+            found = move
+        if found is None:
+            raise ValueError(f"Illegal san: {san!r} in {self.generate_fen()}")
+        return found
+
+    # Legal move generation
+    def check_info(self, color):
+        """
+        Computes what legal move generation needs for the given side, once per position:
+        the pieces giving check, the squares a non-king move has to land on to answer the check,
+        and the pinned pieces together with the ray each may still move along.
+        """
+        if self._check_info and self._check_info[0] == color:
+            return self._check_info[1]
 
-        return is_safe
\ No newline at end of file
+        opponent_color = 'black' if color == 'white' else 'white'
+        theirs = self.bitboards[opponent_color]
+        king = self.bitboards[color][6]
+        occupied = self.occupied()
+        diagonal = theirs[3] | theirs[5]
+        straight = theirs[4] | theirs[5]
+        checkers = BB_EMPTY
+        check_mask = BB_ALL
+        pins = {}
+
+        if king:
+            king_sq = lsb(king)
+            checkers = self.attackers_of(king_sq, opponent_color, occupied)
+            if checkers & (checkers - 1):
+                check_mask = BB_EMPTY  # Double check, only the king can move
+            elif checkers:
+                check_mask = checkers | BB_BETWEEN[king_sq][lsb(checkers)]
+
+            # Sliders that would see the king if our own pieces were not in the way
+            snipers = ((bishop_attacks_from(king_sq, self.occupancy[opponent_color]) & diagonal) |
+                       (rook_attacks_from(king_sq, self.occupancy[opponent_color]) & straight))
+            for sniper in scan(snipers):
+                ray = BB_BETWEEN[king_sq][sniper]
+                blockers = ray & occupied
+                if blockers and not blockers & (blockers - 1) and blockers & self.occupancy[color]:
+                    pins[lsb(blockers)] = ray | BB_SQUARES[sniper]
+
+        info = (checkers, check_mask, pins)
+        self._check_info = (color, info)
+        return info
+
+    def legal_mask(self, piece, sq):
+        """
+        Bitboard of the squares the piece on sq may legally move to, ignoring what it can reach.
+        """
+        if piece.piece_type == 'king':
+            # The king is taken off the board so it cannot hide behind itself on a checking ray
+            opponent_color = 'black' if piece.color == 'white' else 'white'
+            occupied = self.occupied() ^ BB_SQUARES[sq]
+            mask = BB_EMPTY
+            for target in scan(KING_ATTACKS[sq] & ~self.occupancy[piece.color]):
+                if not self.attackers_of(target, opponent_color, occupied):
+                    mask |= BB_SQUARES[target]
+            return mask
+        checkers, check_mask, pins = self.check_info(piece.color)
+        return check_mask & pins.get(sq, BB_ALL)
+
+    def is_safe_en_passant(self, color, from_sq, ep_sq):
+        """
+        En passant takes two pawns off the same rank at once, which the pin rays do not cover.
+        Checks the move by looking at what attacks the king once both pawns are gone.
+        """
+        king = self.bitboards[color][6]
+        if not king:
+            return True
+        opponent_color = 'black' if color == 'white' else 'white'
+        captured = BB_SQUARES[ep_sq - 8 if color == 'white' else ep_sq + 8]
+        occupied = (self.occupied() ^ BB_SQUARES[from_sq] ^ captured) | BB_SQUARES[ep_sq]
+        # The captured pawn still sits in the opponent's bitboards, so drop it from the result
+        return not self.attackers_of(lsb(king), opponent_color, occupied) & ~captured
@@ -1,132 +1,203 @@
 import os
+import threading
+import time
 model_folder_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'model'))
 try:
     from .engineModel import *
+    from .move import *
+    from .boardBatch import BoardBatch
+    from .chessLogic import Board
+    from .openingBook import load_book
+    from .predictionCache import PredictionCache
+    from .modelExport import ExportedModel, load_exported
 except ImportError:
     from engineModel import *
-    model_file_path = os.path.join(model_folder_path, 'savedModels/updated_again_model_current.pth')
-
-    model = ChessNet()
-    model.load_state_dict(torch.load(model_file_path))
-    model.eval()
-import chess
-import chess.pgn
-import random
+    from move import *
+    from boardBatch import BoardBatch
+    from chessLogic import Board
+    from openingBook import load_book
+    from predictionCache import PredictionCache
+    from modelExport import ExportedModel, load_exported
 import numpy as np
 #from model import eco, ChessNet
 
+model_file_path = os.path.join(model_folder_path, 'savedModels/updated_again_model_current.pth')
+openings_file_path = os.path.join(model_folder_path, "eco.pgn")
 
+# Opt in to the int8 quantized model (see quantize_model) by setting CHESS_ENGINE_QUANTIZED=1
+QUANTIZED = os.environ.get('CHESS_ENGINE_QUANTIZED', '0') == '1'
 
-def load_openings_from_pgn(pgn_file):
-    openings = []
-    with open(pgn_file) as f:
-        while True:
-            game = chess.pgn.read_game(f)
-            if game is None:
-                break
+# Moves kept per prediction, the best one is played and all of them are cached
+TOP_K = 5
 
-            board = game.board()
-            moves = []
-            for move in game.mainline_moves():
-                moves.append(board.san(move))
-                board.push(move)
 
-            openings.append(moves)
-    return openings
+# Piece codes of BoardBatch.pieces in the order of the input planes
+PLANE_CODES = np.arange(1, 13, dtype=np.int8).reshape(1, 12, 1)
 
-#Function to find matching openings based on played moves
-def find_matching_openings(played_moves, openings):
+def boards_to_input(boards, out=None):
     """
-    Finding opening works by checking if the played moves match the start of any opening in the opening book.
-    This is because a chosen opening can be diverged from at any point by the opponent.
-    This makes the bot more dynamic in the opening phase.
+    Encodes a list of boards (or a BoardBatch) as one (N, 13, 8, 8) float32 tensor.
+    Planes 0-5 hold the white pawns to king and 6-11 the black ones, indexed [rank, file] with rank 0 the 1st rank.
+    Plane 12 is all ones where white is to move and zeros where black is.
+    out can be a preallocated tensor with room for at least N positions, it is filled and reused instead of allocating.
     """
-    matching_openings = []
-    for opening in openings:
-        if played_moves == opening[:len(played_moves)]:
-            matching_openings.append(opening)
-    return matching_openings
-
-#Function to choose the next move from matching openings
-def select_next_move(played_moves, matching_openings, rand = True):
-    if not matching_openings:
-        return None  # No matching opening found, time for engine
-
-    if rand:
-        chosen_opening = random.choice(matching_openings)
-
-        if len(chosen_opening) > len(played_moves):
-            next_move = chosen_opening[len(played_moves)]
-            return next_move
+    batch = boards if isinstance(boards, BoardBatch) else BoardBatch.from_boards(boards)
+    n = len(batch)
+    if out is None:
+        out = torch.empty((n, 13, 8, 8), dtype=torch.float32)
     else:
-        for opening in matching_openings:
-            if len(opening) > len(played_moves):
-                next_move = opening[len(played_moves)]
-                return next_move
-    return None  # No more moves in the opening book, time for engine
-
-def board_to_input(board, is_white):
-    board_planes = torch.zeros((8, 8, 13), dtype=torch.float32)
-
-    # Iterate over the board's rows and columns (flipped, so row 0 is black's side) 
-    # because the developer was naive enough to believe it would not matter 
-    # and lazy enough to find temporary solutions to the problem along the way
-    for row in range(8):
-        for col in range(8):
-            piece = board.piece_at(row, col)  # Get the piece at the current (row, col)
-            if piece:
-                # Determine the plane based on the piece id and color
-                plane = piece.id - 1  # piece.id ranges from 1 to 6 (pawn, knight, etc.)
-                if piece.color == 'black':
-                    plane += 6  # Shift to black piece planes (6-11)
-
-                # Invert the row index since row 0 on my board is actually row 7 in the neural net input
-                inverted_row = 7 - row
-
-                # Place the piece on the correct plane in the board_planes array
-                board_planes[inverted_row, col, plane] = 1
-
-    # Set the last plane to indicate which side the engine is playing (1 for white, 0 for black)
-    board_planes[:, :, 12] = 1.0 if is_white else 0.0
-    board_input = board_planes.unsqueeze(0).permute(0, 3, 1, 2) 
-
+        out = out[:n]
+    # A square's plane is its piece code - 1, so one comparison against all codes at once fills every piece plane
+    planes = out.view(n, 13, 64)
+    planes[:, :12] = torch.from_numpy(batch.pieces[:, None, :] == PLANE_CODES)
+    planes[:, 12] = torch.from_numpy(batch.turn == 0)[:, None]
+    return out
+
+def board_to_input(board, is_white, out=None):
+    """
+    Input tensor (1, 13, 8, 8) for a single board, with the last plane set by is_white
+    (the side the engine is playing) instead of the side to move.
+    """
+    board_input = boards_to_input([board], out)
+    board_input[:, 12] = 1.0 if is_white else 0.0
     return board_input
 
 
 
-def predict_move(model, board):
+def decode_policy(policy, board, k=1):
+    """
+    The k legal moves the policy (4096 scores, indexed from * 64 + to) rates highest, best first.
+    Only the scores of the legal moves are looked at. The policy has no promotion piece,
+    so a pawn reaching the last rank always promotes to a queen.
+    """
+    candidates = {}
+    for move in board.legal_moves():
+        index = move_index(move)
+        # Promotions share an index, keep the queen (the highest piece id)
+        if index not in candidates or move_promotion(move) > move_promotion(candidates[index]):
+            candidates[index] = move & MOVE_MASK
+    if not candidates:
+        return []
+    indices = torch.tensor(list(candidates), dtype=torch.long)
+    top = policy.reshape(-1)[indices].topk(min(k, len(indices)))
+    return [(candidates[indices[i].item()], score) for i, score in zip(top.indices.tolist(), top.values.tolist())]
+
+def decode_policies(policy, batch, k=1):
+    """
+    decode_policy for every position of a BoardBatch, policy holding 4096 scores per position.
+    Returns a list of the k best legal moves as (move, score) per position, empty for positions without legal moves.
+    """
+    n = len(batch)
+    masks = torch.from_numpy(batch.legal_move_masks())
+    top = policy.reshape(n, 4096).masked_fill(~masks, float('-inf')).topk(k, dim=1)
+    scores, indices = top.values.numpy(), top.indices.numpy()
+    from_squares, to_squares = indices >> 6, indices & 63
+    # Pawns are codes 1 and 7, the only legal moves to the first or last rank of a pawn are promotions
+    promotes = ((batch.pieces[np.arange(n)[:, None], from_squares] % 6 == 1) &
+                ((to_squares < 8) | (to_squares >= 56)))
+    return [[(move_from_index(int(index), PROMOTION_IDS['queen'] if promote else 0), float(score))
+             for index, promote, score in zip(indices[i], promotes[i], scores[i]) if score != float('-inf')]
+            for i in range(n)]
+
+def predict_moves(model, board, k=TOP_K):
+    """
+    The k best legal moves for the side to move as (move, score), best first.
+    """
     board_input = board_to_input(board, board.current_turn == 'white')
     with torch.no_grad():
         output = model(board_input)
-    
-    move_scores = output.squeeze().sort(descending=True)
-    move_indices = move_scores.indices.tolist()
-    
-    for move_index in move_indices:
-        from_square = move_index // 64
-        print(from_square)
-        to_square = move_index % 64
-        move = chess.Move(from_square, to_square)
-        # If pawn and last character is 1 or eight, add 'q' to the move
-        # Hopefully this works, always promotes to queen
-        # Might be redundant right now
-        tmp_board = chess.Board(board.generate_fen())
-
-        if tmp_board.piece_at(from_square).piece_type == 1 and (str(move)[-1] == '1' or str(move)[-1] == '8'):
-            move = chess.Move(from_square, to_square, promotion=5)  
-        print(move, move_scores.values[move_index].item())
-        
-        
-
-        if move in tmp_board.legal_moves:
-            del tmp_board
-            return move
-    
-    # If no valid moves are found (which shouldn't happen), return None
-    return None
+    return decode_policy(output, board, k)
 
-openings_file_path = os.path.join(model_folder_path, "eco.pgn")
-openings = load_openings_from_pgn(openings_file_path)
+def predict_move(model, board):
+    best = predict_moves(model, board, 1)
+    if not best:
+        return None  # No legal moves, the game is over
+    move, score = best[0]
+    print(move_to_uci(move), score)
+    return move
+
+# The model and the opening book are loaded the first time they are asked for, not at import,
+# so importing the package stays cheap. warm_up() loads them ahead of the first move.
+_model = None
+_book = None
+_cache = None
+_load_lock = threading.RLock()
+
+def load_model(checkpoint_path=model_file_path, quantized=None):
+    """
+    Loads a checkpoint as the engine model, replacing the current one. If it has been exported with
+    modelExport.py the exported graphs are served instead of the training module. quantized (QUANTIZED
+    by default) loads the int8 quantized model. Predictions cached for an earlier checkpoint are dropped.
+    """
+    global _model
+    if quantized is None:
+        quantized = QUANTIZED
+    # The graphs are exported from the float model, the quantized one is always built from the checkpoint
+    model = None if quantized else load_exported(checkpoint_path)
+    exported = model is not None
+    if not exported:
+        model = ChessNet()
+        model.load_state_dict(torch.load(checkpoint_path, map_location='cpu'))
+        model.eval()
+        if quantized:
+            model = quantize_model(model)
+    # The same file rewritten by training is a different checkpoint too, and so are its quantized and exported models
+    get_cache().set_checkpoint((os.path.abspath(checkpoint_path), os.stat(checkpoint_path).st_mtime_ns, quantized, exported))
+    _model = model
+    return model
+
+def get_model():
+    """
+    The engine model with the saved weights, in eval mode. Loaded on the first call, shared after that.
+    """
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                load_model()
+    return _model
+
+def get_cache():
+    """
+    The prediction cache shared by every game in the process.
+    """
+    global _cache
+    if _cache is None:
+        with _load_lock:
+            if _cache is None:
+                _cache = PredictionCache()
+    return _cache
+
+def get_book():
+    """
+    The opening book, read from the compiled eco.bin (built from eco.pgn the first time), see openingBook.py.
+    The book follows transpositions, so the opponent can leave a line and still be met with book moves.
+    """
+    global _book
+    if _book is None:
+        with _load_lock:
+            if _book is None:
+                _book = load_book(openings_file_path)
+    return _book
+
+def warm_up(model=None):
+    """
+    Loads the book and the model (unless one is given) and runs a first prediction, which is slower
+    than the ones after it. Returns the seconds each step took, the cold start cost of the engine.
+    """
+    timings = {}
+    start = time.perf_counter()
+    get_book()
+    timings['book'] = time.perf_counter() - start
+    start = time.perf_counter()
+    model = model or get_model()
+    timings['model'] = time.perf_counter() - start
+    start = time.perf_counter()
+    if isinstance(model, ExportedModel):
+        model.warm_up()
+    with torch.no_grad():
+        model(boards_to_input([Board()]))
+    timings['first_prediction'] = time.perf_counter() - start
+    return timings
 
 class Engine:
     def __init__(self, color="white", opening_phase=True, played_moves=[]):
@@ -134,63 +205,35 @@ class Engine:
         self.opening_phase = opening_phase
         self.color = color
 
-    def square_to_algebraic(self, row, col):
-        """
-        Convert (row, col) to algebraic notation (e.g., (6, 3) -> 'd2').
-        Inverts the row to match algebraic notation.
-        """
-        files = 'abcdefgh'
-        rank = 8 - row  # Invert row for algebraic rank (1-8)
-        file = files[col]  # Get file from 'a'-'h'
-        return f"{file}{rank}"
-
     def update(self, move, board, actual = True):
-        from_square, to_square = move
-        from_row, from_col = from_square
-        to_row, to_col = to_square
-
-        from_square_algebraic = self.square_to_algebraic(from_row, from_col)
-        to_square_algebraic = self.square_to_algebraic(to_row, to_col)
-
-        # Combine both into uci format (e.g., 'd2d4')
-        uci_move = f"{from_square_algebraic}{to_square_algebraic}"
-        move_obj = chess.Move.from_uci(uci_move)
-
-        fen = board.generate_fen()
-        tmp_board = chess.Board(fen)
-        move = tmp_board.san(move_obj)
-
-        del tmp_board
+        move = board.san(move)
         if actual:
             self.played_moves.append(move)
         return move
 
-    def engine_move(self, board, model = None):
+    def engine_move(self, board, model = None, scheduler = None, cache = None):
         if self.opening_phase:
-            matching_openings = find_matching_openings(self.played_moves, openings)
-            next_move = select_next_move(self.played_moves, matching_openings)
+            next_move = get_book().choose(board)
         if self.opening_phase and next_move:
             print("Opening move")
-            self.played_moves.append(next_move)
-            fen = board.generate_fen()
-            tmp_board = chess.Board(fen)
-            move = tmp_board.parse_san(next_move)
-            # Really ugly, but I made my own parse_move in the board class. 
-            # Does not look pretty right below the Chess library's parse_san, 
-            # but theirs simplify the notation while mine converts it to the notation my board uses.
-            move_a = board.parse_move(move) 
-            del tmp_board
-            return move_a, move
+            self.played_moves.append(board.san(next_move))
+            return next_move
         else:
             print("Engine move")
             print(board.current_turn)
             if (board.current_turn == self.color):
-                bot_move = predict_move(model, board)
-                print(bot_move)
+                top = cache.get(board) if cache is not None else None
+                if top is None:
+                    checkpoint = cache.checkpoint if cache is not None else None
+                    # With a scheduler the position is batched with the ones of other games
+                    if scheduler:
+                        top = scheduler.predict_moves(board)
+                    else:
+                        top = predict_moves(model or get_model(), board)
+                    if cache is not None:
+                        cache.put(board, top, checkpoint)
+                bot_move = top[0][0] if top else None
                 self.opening_phase = False
-                if bot_move:
-                    return board.parse_move(bot_move), bot_move
-                else:
-                    return None
+                return bot_move
             else:
                 return None
\ No newline at end of file
@@ -83,4 +83,10 @@ class PositionalEncoding(nn.Module):
         self.encoding = self.encoding.unsqueeze(1)
 
     def forward(self, x):
-        return x + self.encoding[:x.size(0), :].to(x.device)
\ No newline at end of file
+        return x + self.encoding[:x.size(0), :].to(x.device)
+
+#Dynamic int8 quantization for CPU inference. The weights of every Linear layer (fc1 and the feed forward
+#layers of the transformer) are stored as int8 and the activations are quantized on the fly, the convolutions stay float.
+#Attention projections are left as they are by torch. Check the moves still agree with quantizationCheck.py before using it
+def quantize_model(model):
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
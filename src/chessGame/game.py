@@ -126,6 +126,7 @@ def main():
     selected_pos = None
     dragging = False
     valid_moves = []
+    game_over = False
 
     while running:
         for event in pygame.event.get():
@@ -201,12 +202,18 @@ def main():
             board.promotion_piece(piece)
             print(board.current_turn)
 
+        # Announce the end of the game once, the engine stops playing after it
+        outcome = board.outcome()
+        if outcome and not game_over:
+            game_over = True
+            termination, winner = outcome
+            print(f"Game over by {termination}. " + (f"{winner} wins." if winner else "The game is a draw."))
+
         # Handle the engine's turn
-        if board.current_turn == engine_color:
-            move, _ = engine.engine_move(board)
-            engine_start_pos, engine_end_pos = move
-            print(engine_start_pos, engine_end_pos)
-            board.move_piece(engine_start_pos, engine_end_pos, None)
+        if board.current_turn == engine_color and not game_over:
+            move = engine.engine_move(board)
+            print(chess.move_to_uci(move))
+            board.play(move)
 
         # Promotion to choose piece
         if board.promotion:
@@ -0,0 +1,125 @@
+""""""""""""""""""
+"   SCHEDULER    "
+""""""""""""""""""
+# Batches the positions of concurrent games into one forward pass. A single position costs the
+# model about as much as a few dozen, so callers hand their board to the scheduler thread, which waits
+# up to max_wait for more positions to arrive (or until max_batch_size is reached), predicts them
+# all at once and gives every caller the moves for its own board.
+import queue
+import threading
+import time
+from concurrent.futures import Future
+try:
+    from .engineIntegration import *
+except ImportError:
+    from engineIntegration import *
+
+
+class InferenceScheduler:
+    def __init__(self, model=None, max_batch_size=32, max_wait=0.002, k=TOP_K):
+        # Without a model every batch runs on get_model(), so a newly loaded checkpoint is picked up
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.k = k
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        # Reused for every batch, only the scheduler thread fills it
+        self.input = torch.empty((max_batch_size, 13, 8, 8), dtype=torch.float32)
+        self.batches = 0
+        self.positions = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='inference-scheduler', daemon=True)
+        self.thread.start()
+
+    def submit(self, board):
+        """
+        Queues the board and returns a Future for its k best moves as (move, score), best first
+        (empty when it has no legal moves). The board must not change until the future is done.
+        """
+        if self.closed:
+            raise RuntimeError("InferenceScheduler is closed")
+        future = Future()
+        self.requests.put((board, future))
+        return future
+
+    def predict_moves(self, board, timeout=None):
+        """
+        The k best moves for the board, waiting for the batch it ends up in.
+        """
+        return self.submit(board).result(timeout)
+
+    def predict(self, board, timeout=None):
+        """
+        The move the model plays on the board, None when there is none.
+        """
+        top = self.predict_moves(board, timeout)
+        return top[0][0] if top else None
+
+    def predict_batch(self, boards):
+        """
+        One forward pass over the boards (at most max_batch_size), returns their top moves in order.
+        """
+        batch = BoardBatch.from_boards(boards)
+        model = self.model or get_model()
+        with torch.no_grad():
+            policy = model(boards_to_input(batch, self.input))
+        return decode_policies(policy, batch, self.k)
+
+    def mean_batch_size(self):
+        return self.positions / self.batches if self.batches else 0.0
+
+    def run(self):
+        stop = False
+        while not stop:
+            request = self.requests.get()
+            if request is None:
+                break
+            pending = [request]
+            deadline = time.monotonic() + self.max_wait
+            while len(pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                pending.append(request)
+            self.run_batch(pending)
+
+    def run_batch(self, pending):
+        try:
+            moves = self.predict_batch([board for board, _ in pending])
+        except Exception as e:
+            # Every caller in the batch sees the error instead of waiting forever
+            for _, future in pending:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.positions += len(pending)
+        for (_, future), move in zip(pending, moves):
+            future.set_result(move)
+
+    def close(self):
+        """
+        Stops the scheduler thread once the positions queued so far are predicted.
+        """
+        self.closed = True
+        self.requests.put(None)
+        self.thread.join()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """
+    The scheduler shared by every game in the process, running get_model(). Started on the first call.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = InferenceScheduler()
+    return _scheduler
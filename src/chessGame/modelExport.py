@@ -0,0 +1,169 @@
+""""""""""""""""""
+"     EXPORT     "
+""""""""""""""""""
+# Turns a checkpoint into inference only TorchScript graphs, one per batch size, for serving.
+# Every BatchNorm is folded into the convolution before it, the positional encoding becomes a constant
+# of the graph and the traced graph is frozen, so a forward pass is one call into the graph instead of
+# a Python call per layer. The graphs are saved next to the checkpoint, in <checkpoint>.exported/.
+import argparse
+import copy
+import glob
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+try:
+    from .engineModel import *
+except ImportError:
+    from engineModel import *
+
+EXPORT_BATCH_SIZES = (1, 8, 32)
+_GRAPH_FILE = re.compile(r"chessnet_b(\d+)\.pt$")
+
+
+class ConstantPositionalEncoding(nn.Module):
+    """
+    PositionalEncoding for the 64 squares with the encoding as a buffer, so it is traced in as a constant.
+    """
+    def __init__(self, encoding):
+        super(ConstantPositionalEncoding, self).__init__()
+        self.register_buffer('encoding', encoding[:64].clone())
+
+    def forward(self, x):
+        return x + self.encoding
+
+
+def prepare_for_export(model):
+    """
+    Copy of a ChessNet in eval mode with every BatchNorm folded into its convolution and the constant positional encoding.
+    """
+    model = copy.deepcopy(model).eval()
+    for conv, bn in (('conv1', 'bn1'), ('conv2', 'bn2'), ('conv3', 'bn3')):
+        setattr(model, conv, fuse_conv_bn_eval(getattr(model, conv), getattr(model, bn)))
+        setattr(model, bn, nn.Identity())
+    model.positional_encoding = ConstantPositionalEncoding(model.positional_encoding.encoding)
+    return model
+
+def export_model(model, batch_size):
+    """
+    Frozen TorchScript graph of the model for batches of exactly batch_size positions.
+    """
+    example = torch.zeros((batch_size, 13, 8, 8), dtype=torch.float32)
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(prepare_for_export(model), example))
+
+def export_dir_of(checkpoint_path):
+    return os.path.splitext(checkpoint_path)[0] + '.exported'
+
+def export_checkpoint(checkpoint_path, export_dir=None, batch_sizes=EXPORT_BATCH_SIZES):
+    """
+    Exports the model in the checkpoint for every batch size. Each graph is written next to its file and then
+    moved into place, like the opening book, so a server loading them never reads a half written one.
+    """
+    export_dir = export_dir or export_dir_of(checkpoint_path)
+    model = ChessNet()
+    model.load_state_dict(torch.load(checkpoint_path, map_location='cpu'))
+    model.eval()
+    os.makedirs(export_dir, exist_ok=True)
+    graphs = {}
+    for batch_size in batch_sizes:
+        graph = export_model(model, batch_size)
+        fd, tmp_file = tempfile.mkstemp(dir=export_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            torch.jit.save(graph, tmp_file)
+            os.replace(tmp_file, os.path.join(export_dir, f"chessnet_b{batch_size}.pt"))
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+        graphs[batch_size] = graph
+    return model, ExportedModel(graphs)
+
+
+class ExportedModel:
+    """
+    The exported graphs used like the model. A batch runs through the graph of the smallest batch size
+    it fits in, padded with empty positions, and a batch larger than every graph in pieces.
+    """
+    def __init__(self, graphs):
+        self.graphs = dict(sorted(graphs.items()))
+
+    @classmethod
+    def load(cls, export_dir):
+        graphs = {}
+        for graph_file in glob.glob(os.path.join(export_dir, 'chessnet_b*.pt')):
+            match = _GRAPH_FILE.search(graph_file)
+            if match:
+                graphs[int(match.group(1))] = torch.jit.load(graph_file, map_location='cpu')
+        return cls(graphs)
+
+    def __call__(self, x):
+        n = x.shape[0]
+        largest = max(self.graphs)
+        if n > largest:
+            return torch.cat([self(x[start:start + largest]) for start in range(0, n, largest)])
+        batch_size = next(size for size in self.graphs if size >= n)
+        if batch_size > n:
+            x = torch.cat([x, x.new_zeros((batch_size - n,) + tuple(x.shape[1:]))])
+        return self.graphs[batch_size](x)[:n]
+
+    def warm_up(self, runs=3):
+        """
+        Runs every graph a few times, TorchScript optimizes a graph over its first runs.
+        """
+        with torch.no_grad():
+            for batch_size, graph in self.graphs.items():
+                for _ in range(runs):
+                    graph(torch.zeros((batch_size, 13, 8, 8), dtype=torch.float32))
+
+
+def load_exported(checkpoint_path):
+    """
+    The exported model of a checkpoint, or None when it has not been exported or was exported before the checkpoint last changed.
+    """
+    graph_files = glob.glob(os.path.join(export_dir_of(checkpoint_path), 'chessnet_b*.pt'))
+    if not graph_files or min(os.path.getmtime(f) for f in graph_files) < os.path.getmtime(checkpoint_path):
+        return None
+    return ExportedModel.load(export_dir_of(checkpoint_path))
+
+
+def median_time(model, x, repeats=10):
+    """
+    Median milliseconds of a forward pass of x.
+    """
+    times = []
+    with torch.no_grad():
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(x)
+            times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export a checkpoint of the engine model to frozen TorchScript graphs for serving")
+    parser.add_argument('checkpoint', nargs='?',
+                        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model',
+                                             'savedModels', 'updated_again_model_current.pth'),
+                        help="model weights to export (the served model by default)")
+    parser.add_argument('-o', '--output', help="directory for the graphs (<checkpoint>.exported by default)")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=list(EXPORT_BATCH_SIZES))
+    args = parser.parse_args(argv)
+    model, exported = export_checkpoint(args.checkpoint, args.output, args.batch_sizes)
+
+    # The graphs should give the outputs of the model they came from, and faster
+    exported.warm_up()
+    with torch.no_grad():
+        for batch_size, graph in exported.graphs.items():
+            x = torch.rand((batch_size, 13, 8, 8)).round()
+            difference = (model(x) - graph(x)).abs().max().item()
+            print(f"Batch {batch_size:>3}: max difference {difference:.2e}, "
+                  f"model {median_time(model, x):.2f} ms, graph {median_time(graph, x):.2f} ms")
+    print(f"Exported to {args.output or export_dir_of(args.checkpoint)}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
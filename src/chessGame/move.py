@@ -0,0 +1,80 @@
+""""""""""""""""""
+"     MOVES      "
+""""""""""""""""""
+# Moves are plain ints, laid out so the low 12 bits are the index of the move
+# in the 4096-way policy output of the model (from_square * 64 + to_square):
+#
+#   bits  0-5   to square
+#   bits  6-11  from square
+#   bits 12-14  piece id to promote to (2 knight, 3 bishop, 4 rook, 5 queen), 0 if none
+#   bits 15-18  flags, filled in by Board.legal_moves and ignored by Board.push
+#
+# Squares are numbered like the bitboards, a1 = 0 ... h8 = 63.
+
+MOVE_INDEX_MASK = 0xFFF
+PROMOTION_SHIFT = 12
+# From, to and promotion without the flags. Two moves are the same move when these bits match.
+MOVE_MASK = 0x7FFF
+
+FLAG_CAPTURE = 1 << 15
+FLAG_EN_PASSANT = 1 << 16
+FLAG_CASTLING = 1 << 17
+FLAG_DOUBLE_PUSH = 1 << 18
+
+PROMOTION_IDS = {'knight': 2, 'bishop': 3, 'rook': 4, 'queen': 5}
+PROMOTION_TYPES = {piece_id: piece_type for piece_type, piece_id in PROMOTION_IDS.items()}
+PROMOTION_CHARS = {2: 'n', 3: 'b', 4: 'r', 5: 'q'}
+PROMOTION_IDS_BY_CHAR = {char: piece_id for piece_id, char in PROMOTION_CHARS.items()}
+
+SQUARE_NAMES = [f"{file}{rank}" for rank in '12345678' for file in 'abcdefgh']
+SQUARES_BY_NAME = {name: sq for sq, name in enumerate(SQUARE_NAMES)}
+
+
+def encode_move(from_sq, to_sq, promotion=0, flags=0):
+    """
+    Packs a move into an int. promotion is the piece id to promote to, or 0.
+    """
+    return (from_sq << 6) | to_sq | (promotion << PROMOTION_SHIFT) | flags
+
+def move_from_square(move):
+    return (move >> 6) & 63
+
+def move_to_square(move):
+    return move & 63
+
+def move_promotion(move):
+    return (move >> PROMOTION_SHIFT) & 7
+
+def move_index(move):
+    """
+    Index of the move in the policy output of the model.
+    """
+    return move & MOVE_INDEX_MASK
+
+def move_from_index(index, promotion=0):
+    return index | (promotion << PROMOTION_SHIFT)
+
+
+def move_to_uci(move):
+    """
+    UCI notation of a move, e.g. 'e2e4' or 'e7e8q'.
+    """
+    uci = SQUARE_NAMES[(move >> 6) & 63] + SQUARE_NAMES[move & 63]
+    promotion = (move >> PROMOTION_SHIFT) & 7
+    if promotion:
+        uci += PROMOTION_CHARS[promotion]
+    return uci
+
+def move_from_uci(uci):
+    """
+    Parses UCI notation (e.g. 'e2e4', 'e7e8q') into a move without flags.
+    Raises ValueError if the text is not a move.
+    """
+    if len(uci) not in (4, 5) or uci[:2] not in SQUARES_BY_NAME or uci[2:4] not in SQUARES_BY_NAME:
+        raise ValueError(f"Invalid uci move: {uci!r}")
+    promotion = 0
+    if len(uci) == 5:
+        if uci[4] not in PROMOTION_IDS_BY_CHAR:
+            raise ValueError(f"Invalid promotion in uci move: {uci!r}")
+        promotion = PROMOTION_IDS_BY_CHAR[uci[4]]
+    return encode_move(SQUARES_BY_NAME[uci[:2]], SQUARES_BY_NAME[uci[2:4]], promotion)
@@ -0,0 +1,239 @@
+""""""""""""""""""
+"  OPENING BOOK  "
+""""""""""""""""""
+# Book moves indexed by the Zobrist key of the position they are played from, so a lookup is a
+# single dict access and a position reached through a different move order than the one in the
+# book still finds its moves. Every move is weighted by the number of book lines that play it there.
+#
+# Parsing the PGN means replaying every line, so the book is compiled once into a binary file laid
+# out like a Polyglot book: 16 byte big-endian entries (key, move, weight, learn) sorted by key.
+# The keys are our own Zobrist keys and the moves our move ints, so the file is not readable by
+# other Polyglot tools. A header of the size of an entry comes first, it holds a fingerprint of the
+# Zobrist keys and the move layout the file was written with, and a file that does not match the
+# running code is compiled again. It is memory mapped and searched in place, so loading it costs next to
+# nothing and every process serving the engine shares the same pages.
+import argparse
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+import tempfile
+import zlib
+try:
+    from .chessLogic import Board
+    from .move import *
+    from .zobrist import *
+except ImportError:
+    from chessLogic import Board
+    from move import *
+    from zobrist import *
+
+# Move numbers ("1.", "12...") and game results in PGN movetext
+PGN_NOISE = re.compile(r"\d+\.+|1-0|0-1|1/2-1/2|\*")
+
+# key, move, weight, learn (always 0)
+ENTRY = struct.Struct('>QHHI')
+_KEY = struct.Struct('>Q')
+MAX_WEIGHT = 0xFFFF
+
+# magic, format version, fingerprint
+HEADER = struct.Struct('>8sII')
+BOOK_MAGIC = b'ECOBOOK\0'
+BOOK_FORMAT = 1
+
+
+def book_fingerprint():
+    """
+    CRC of every Zobrist key and of a few encoded moves. Changes when the keys or the move layout do,
+    which would make the keys or the moves stored in a compiled book mean something else.
+    """
+    keys = [key for color in ('white', 'black') for keys in PIECE_KEYS[color] for key in keys]
+    keys += CASTLING_KEYS + EN_PASSANT_KEYS + [TURN_KEY]
+    moves = [encode_move(12, 28), encode_move(52, 60, PROMOTION_IDS['queen']), encode_move(6, 63, PROMOTION_IDS['knight'])]
+    return zlib.crc32(struct.pack(f'>{len(keys)}Q{len(moves)}I', *keys, *moves))
+
+def book_header():
+    return HEADER.pack(BOOK_MAGIC, BOOK_FORMAT, book_fingerprint())
+
+
+def read_pgn_lines(pgn_file):
+    """
+    Yields the moves of every game in a PGN file as a list of SAN strings.
+    Only what eco.pgn uses is supported: tag pairs, then the movetext, without comments or variations.
+    """
+    movetext = []
+    with open(pgn_file) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('['):
+                # Tags start the next game
+                if movetext:
+                    yield PGN_NOISE.sub(' ', ' '.join(movetext)).split()
+                    movetext = []
+            elif line:
+                movetext.append(line)
+    if movetext:
+        yield PGN_NOISE.sub(' ', ' '.join(movetext)).split()
+
+
+class OpeningBook:
+    """
+    Maps position keys to the book moves from that position and their weights: {key: {move: weight}}.
+    """
+    def __init__(self):
+        self.entries = {}
+
+    @classmethod
+    def from_pgn(cls, pgn_file):
+        book = cls()
+        for line in read_pgn_lines(pgn_file):
+            book.add_line(line)
+        return book
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add_line(self, sans, weight=1):
+        """
+        Adds the moves of a line (SAN strings, played from the initial position) to the book.
+        """
+        board = Board()
+        for san in sans:
+            move = board.parse_san(san)
+            moves = self.entries.setdefault(board.zobrist, {})
+            moves[move] = moves.get(move, 0) + weight
+            board.push(move)
+
+    def moves(self, board):
+        """
+        The book moves for the position on the board as (move, weight), most played first.
+        Empty when the position is not in the book.
+        """
+        moves = self.entries.get(board.zobrist)
+        if not moves:
+            return []
+        return sorted(moves.items(), key=lambda item: item[1], reverse=True)
+
+    def choose(self, board, rand=True):
+        """
+        Picks a book move for the board, at random in proportion to the weights or else the most played one.
+        Returns None when the position is not in the book, time for the engine.
+        Moves that are not legal on the board are never picked, whatever the book says.
+        """
+        moves = [(move, weight) for move, weight in self.moves(board) if board.is_legal(move)]
+        if not moves:
+            return None
+        if rand:
+            return random.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+        return moves[0][0]
+
+    def write(self, book_file):
+        """
+        Compiles the book into book_file. The file is written next to it first and then moved into place,
+        so a process loading the book at the same time never sees a half written file.
+        """
+        entries = sorted((key, -weight, move) for key, moves in self.entries.items() for move, weight in moves.items())
+        data = book_header() + b''.join(ENTRY.pack(key, move & MOVE_MASK, min(-weight, MAX_WEIGHT), 0) for key, weight, move in entries)
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(book_file)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            # mkstemp creates the file readable by its owner only
+            os.chmod(tmp_file, 0o644)
+            os.replace(tmp_file, book_file)
+        except BaseException:
+            os.remove(tmp_file)
+            raise
+        return len(entries)
+
+
+class CompiledBook(OpeningBook):
+    """
+    An opening book read from a file written by OpeningBook.write, looked up with a binary search
+    over the memory mapped entries instead of a dict.
+    Raises ValueError if the file was not written by this version of the code.
+    """
+    def __init__(self, book_file):
+        super().__init__()
+        with open(book_file, 'rb') as f:
+            if f.read(HEADER.size) != book_header():
+                raise ValueError(f"{book_file} is not a compiled book of this version")
+            size = os.fstat(f.fileno()).st_size
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Entries are numbered from after the header, which has the size of one
+        self.size = size // ENTRY.size - 1
+
+    def __len__(self):
+        # Positions, like OpeningBook, every key starts a run of entries
+        return sum(1 for i in range(self.size) if i == 0 or self.key_at(i) != self.key_at(i - 1))
+
+    def key_at(self, i):
+        return _KEY.unpack_from(self.data, (i + 1) * ENTRY.size)[0]
+
+    def find(self, key):
+        """
+        Index of the first entry with the key, or of the first one after where it would be.
+        """
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def moves(self, board):
+        """
+        The book moves for the position on the board as (move, weight), most played first.
+        Empty when the position is not in the book.
+        """
+        moves = []
+        i = self.find(board.zobrist)
+        while i < self.size:
+            key, move, weight, _ = ENTRY.unpack_from(self.data, (i + 1) * ENTRY.size)
+            if key != board.zobrist:
+                break
+            moves.append((move, weight))
+            i += 1
+        return moves
+
+
+def load_book(pgn_file, book_file=None):
+    """
+    The compiled book of a PGN file, by default stored next to it as .bin.
+    It is compiled first when the file is missing, older than the PGN or written by a version of the code
+    with other Zobrist keys or moves. If it cannot be written (a read-only install) the book parsed
+    from the PGN is used as it is.
+    """
+    if book_file is None:
+        book_file = os.path.splitext(pgn_file)[0] + '.bin'
+    if os.path.exists(book_file) and os.path.getmtime(book_file) >= os.path.getmtime(pgn_file):
+        try:
+            return CompiledBook(book_file)
+        except ValueError:
+            pass
+    book = OpeningBook.from_pgn(pgn_file)
+    try:
+        book.write(book_file)
+    except OSError:
+        return book
+    return CompiledBook(book_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a PGN opening book into the binary book the engine loads")
+    parser.add_argument('pgn', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'model', 'eco.pgn'),
+                        help="PGN file with the book lines (the eco.pgn of the engine by default)")
+    parser.add_argument('-o', '--output', help="book file to write (the PGN file name with .bin by default)")
+    args = parser.parse_args(argv)
+    output = args.output or os.path.splitext(args.pgn)[0] + '.bin'
+    book = OpeningBook.from_pgn(args.pgn)
+    entries = book.write(output)
+    print(f"{output}: {len(book)} positions, {entries} moves, {(entries + 1) * ENTRY.size} bytes")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+""""""""""""""""""
+"     PERFT      "
+""""""""""""""""""
+# Counts the leaf nodes of the legal move tree to a fixed depth and compares them with the
+# published numbers for the standard test positions. Doubles as a speed benchmark for chessLogic.
+#
+#   python perft.py                      all standard positions to depth 3
+#   python perft.py kiwipete -d 4        one position, deeper
+#   python perft.py --fen "<fen>" -d 2 --divide
+#   python perft.py initial -d 3 --check (cross-checks every node against python-chess, slow)
+#   python perft.py -d 5 -j 0             deep run split over every core
+#   python perft.py -d 5 --hash 1000000   cache subtree counts of transposed positions
+import argparse
+import multiprocessing
+import sys
+import time
+try:
+    from .chessLogic import Board
+    from .move import move_to_uci
+except ImportError:
+    from chessLogic import Board
+    from move import move_to_uci
+
+# Standard perft positions and their node counts for depth 1, 2, 3, ...
+# (https://www.chessprogramming.org/Perft_Results)
+PERFT_POSITIONS = {
+    'initial': ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                [20, 400, 8902, 197281, 4865609, 119060324]),
+    'kiwipete': ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 [48, 2039, 97862, 4085603, 193690690]),
+    'position3': ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                  [14, 191, 2812, 43238, 674624, 11030083]),
+    'position4': ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  [6, 264, 9467, 422333, 15833292]),
+    'position5': ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                  [44, 1486, 62379, 2103487, 89941194]),
+    'position6': ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                  [46, 2079, 89890, 3894594, 164075551]),
+}
+
+class PerftTable:
+    """
+    Fixed-size cache of (Zobrist key, depth) -> node count, so a position reached again
+    through a different move order is not counted twice. Entries live in slots picked by
+    the key and a new entry always replaces whatever was in its slot.
+    A wrong count with the table on, but not without it, points at a hashing bug in the board.
+    """
+    def __init__(self, entries=1 << 20):
+        size = 1
+        while size < entries:
+            size <<= 1
+        self.mask = size - 1
+        self.entries = [None] * size
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.replaced = 0
+
+    def get(self, key, depth):
+        self.probes += 1
+        entry = self.entries[(key ^ depth) & self.mask]
+        if entry and entry[0] == key and entry[1] == depth:
+            self.hits += 1
+            return entry[2]
+        return None
+
+    def put(self, key, depth, nodes):
+        index = (key ^ depth) & self.mask
+        if self.entries[index]:
+            self.replaced += 1
+        self.entries[index] = (key, depth, nodes)
+        self.stores += 1
+
+
+def perft(board, depth, table=None):
+    """
+    Returns the number of leaf nodes (positions) reached at the given depth.
+    Subtree counts are looked up in and stored to the PerftTable when one is given.
+    """
+    if depth == 0:
+        return 1
+    if table:
+        nodes = table.get(board.zobrist, depth)
+        if nodes is not None:
+            return nodes
+    moves = board.legal_moves()
+    if depth == 1:
+        nodes = len(moves)  # No need to play the last ply just to count it
+    else:
+        nodes = 0
+        for move in moves:
+            board.push(move)
+            nodes += perft(board, depth - 1, table)
+            board.pop()
+    if table:
+        table.put(board.zobrist, depth, nodes)
+    return nodes
+
+
+def divide(board, depth, table=None):
+    """
+    Perft split by root move. Returns a dict of uci move -> node count below it.
+    """
+    counts = {}
+    for move in board.legal_moves():
+        uci = move_to_uci(move)
+        board.push(move)
+        counts[uci] = perft(board, depth - 1, table)
+        board.pop()
+    return counts
+
+
+def split_tasks(board, depth, split_depth=1):
+    """
+    Splits a perft into independent tasks, one for every position split_depth plies below the root.
+    Returns (root uci, moves from the root, remaining depth) tuples.
+    """
+    tasks = []
+    for move in board.legal_moves():
+        uci = move_to_uci(move)
+        if split_depth > 1 and depth > 2:
+            board.push(move)
+            for reply in board.legal_moves():
+                tasks.append((uci, (move, reply), depth - 2))
+            board.pop()
+        else:
+            tasks.append((uci, (move,), depth - 1))
+    return tasks
+
+
+# Every worker process keeps its own table for all the tasks it runs
+_worker_table = None
+
+def _init_worker(hash_entries):
+    global _worker_table
+    _worker_table = PerftTable(hash_entries) if hash_entries else None
+
+
+def _run_task(task):
+    fen, root_uci, moves, depth = task
+    board = Board(fen)
+    for move in moves:
+        board.push(move)
+    if not _worker_table:
+        return root_uci, perft(board, depth), 0, 0
+    hits, probes = _worker_table.hits, _worker_table.probes
+    nodes = perft(board, depth, _worker_table)
+    return root_uci, nodes, _worker_table.hits - hits, _worker_table.probes - probes
+
+
+def parallel_divide(pool, fen, depth, split_depth=1, table=None):
+    """
+    Divide run on a process pool. The tree is split split_depth plies below the root,
+    every worker counts its own subtrees and the counts are merged per root move.
+    Hits and probes of the workers' tables are added to table when one is given.
+    """
+    if depth < 1:
+        return {}
+    board = Board(fen)
+    # Root moves answered by mate or stalemate get no task, but still show up with 0 nodes
+    counts = {move_to_uci(move): 0 for move in board.legal_moves()}
+    tasks = [(fen, root_uci, moves, remaining) for root_uci, moves, remaining in split_tasks(board, depth, split_depth)]
+    for root_uci, nodes, hits, probes in pool.imap_unordered(_run_task, tasks):
+        counts[root_uci] += nodes
+        if table:
+            table.hits += hits
+            table.probes += probes
+    return counts
+
+
+def perft_checked(board, depth, path=""):
+    """
+    Perft that compares the legal moves with python-chess at every node and prints every discrepancy,
+    together with the moves that lead to it. Much slower than perft, only for hunting move generation bugs.
+    """
+    import chess  # python-chess, only needed here
+
+    moves = board.legal_moves()
+    ours = {move_to_uci(move) for move in moves}
+    theirs = {move.uci() for move in chess.Board(board.generate_fen()).legal_moves}
+    if ours != theirs:
+        print(f"Discrepancy after moves: {path or '(root)'} in {board.generate_fen()}")
+        for uci in sorted(ours - theirs):
+            print(f"  Missing move: {uci} in python-chess (present in custom engine).")
+        for uci in sorted(theirs - ours):
+            print(f"  Missing move: {uci} in custom engine (present in python-chess).")
+
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        new_path = path + " -> " + move_to_uci(move)
+        board.push(move)
+        nodes += perft_checked(board, depth - 1, new_path)
+        board.pop()
+    return nodes
+
+
+def run(name, fen, depth, expected=None, divide_moves=False, check=False, pool=None, split_depth=1, hash_entries=0):
+    """
+    Runs one perft and prints nodes, time and nodes per second.
+    The run is spread over the process pool when one is given, and uses a PerftTable
+    of hash_entries entries (one per worker when running on the pool) when that is set.
+    Returns the node count, the time it took and whether the count matched the expected one.
+    """
+    board = Board(fen)
+    table = PerftTable(hash_entries) if hash_entries and not check else None
+    start = time.perf_counter()
+    if pool and not check:
+        counts = parallel_divide(pool, fen, depth, split_depth, table)
+        if divide_moves:
+            for uci, count in sorted(counts.items()):
+                print(f"{uci}: {count}")
+        nodes = sum(counts.values())
+    elif divide_moves:
+        counts = divide(board, depth, table)
+        for uci, count in sorted(counts.items()):
+            print(f"{uci}: {count}")
+        nodes = sum(counts.values())
+    elif check:
+        nodes = perft_checked(board, depth)
+    else:
+        nodes = perft(board, depth, table)
+    elapsed = time.perf_counter() - start
+
+    ok = expected is None or nodes == expected
+    status = "" if expected is None else ("ok" if ok else f"FAILED, expected {expected}")
+    nps = nodes / elapsed if elapsed > 0 else 0
+    print(f"{name:<10} depth {depth}  nodes {nodes:>10}  time {elapsed:8.3f}s  nps {nps:>9.0f}  {status}")
+    if table:
+        hit_rate = table.hits / table.probes if table.probes else 0
+        print(f"{'':<10} hash probes {table.probes}  hits {table.hits} ({hit_rate:.1%})", end='')
+        # Stores and replacements happen in the workers when running on a pool
+        print('' if pool else f"  stores {table.stores}  replaced {table.replaced}")
+    return nodes, elapsed, ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft test and benchmark for chessLogic.Board")
+    parser.add_argument('positions', nargs='*', default=list(PERFT_POSITIONS),
+                        help=f"standard positions to run ({', '.join(PERFT_POSITIONS)}), all by default")
+    parser.add_argument('--fen', help="run a custom position instead of the standard ones")
+    parser.add_argument('-d', '--depth', type=int, default=3)
+    parser.add_argument('--divide', action='store_true', help="print the node count below every root move")
+    parser.add_argument('--check', action='store_true', help="compare every node with python-chess")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="worker processes to split the run over, 0 for one per core")
+    parser.add_argument('--split', type=int, choices=(1, 2),
+                        help="plies below the root to split the work at (default: 2 from depth 4 on, else 1)")
+    parser.add_argument('--hash', type=int, default=0, metavar='ENTRIES',
+                        help="cache subtree counts in a table of this many entries (rounded up to a power of two)")
+    args = parser.parse_args(argv)
+    if args.depth < 1:
+        parser.error("depth must be at least 1")
+    jobs = args.jobs or multiprocessing.cpu_count()
+    split_depth = args.split or (2 if args.depth >= 4 else 1)
+
+    if args.fen:
+        runs = [('custom', args.fen, None)]
+    else:
+        runs = []
+        for name in args.positions:
+            if name not in PERFT_POSITIONS:
+                parser.error(f"unknown position {name}")
+            fen, counts = PERFT_POSITIONS[name]
+            runs.append((name, fen, counts[args.depth - 1] if 1 <= args.depth <= len(counts) else None))
+
+    total_nodes, total_time, ok = 0, 0.0, True
+    pool = None
+    if jobs > 1 and not args.check:
+        pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(args.hash,))
+    try:
+        for name, fen, expected in runs:
+            nodes, elapsed, matched = run(name, fen, args.depth, expected, args.divide, args.check, pool, split_depth, args.hash)
+            total_nodes += nodes
+            total_time += elapsed
+            ok = ok and matched
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    if len(runs) > 1:
+        print(f"{'total':<10} depth {args.depth}  nodes {total_nodes:>10}  time {total_time:8.3f}s  nps {total_nodes / total_time:>9.0f}")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+""""""""""""""""""
+"   PREDICTION   "
+""""""""""""""""""
+# Remembers what the model predicted for a position, so a position many games reach (the first
+# ones after the book runs out) is only run through the model once. Entries are keyed by the
+# Zobrist key and the side to move, kept for at most ttl seconds and dropped least recently
+# used first once the cache holds max_size positions. They belong to the checkpoint they were
+# predicted with, switching to another one empties the cache.
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    def __init__(self, max_size=100000, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (expiry time, top moves), least recently used first
+        self.entries = OrderedDict()
+        self.checkpoint = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def key(board):
+        return board.zobrist, board.current_turn
+
+    def get(self, board):
+        """
+        The cached top moves for the board as [(move, score)], or None if the position is not cached.
+        """
+        key = self.key(board)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                # Expired entries count as evictions, they are removed when they are looked up
+                del self.entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, board, moves, checkpoint=None):
+        """
+        Caches the top moves predicted for the board. checkpoint is the one the cache was on when the
+        prediction started (self.checkpoint by default), if it has changed since the moves are dropped.
+        """
+        key = self.key(board)
+        with self.lock:
+            if checkpoint is not None and checkpoint != self.checkpoint:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, moves)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_checkpoint(self, checkpoint):
+        """
+        Marks the model checkpoint the predictions come from, clearing the cache if it is a different one.
+        """
+        with self.lock:
+            if checkpoint != self.checkpoint:
+                self.entries.clear()
+                self.checkpoint = checkpoint
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,133 @@
+""""""""""""""""""
+"  QUANTIZATION  "
+""""""""""""""""""
+# Compares the int8 quantized model (engineModel.quantize_model) with the float model it comes from:
+# how often both play the same move, how long a forward pass takes and how big the weights are.
+# Exits with status 1 when the agreement is below the thresholds, so switching serving to the
+# quantized model (CHESS_ENGINE_QUANTIZED=1) can be gated on it.
+import argparse
+import io
+import random
+import statistics
+import sys
+import time
+try:
+    from .engineIntegration import *
+    from .chessLogic import Board
+    from .openingBook import read_pgn_lines
+except ImportError:
+    from engineIntegration import *
+    from chessLogic import Board
+    from openingBook import read_pgn_lines
+
+
+def sample_positions(count, seed=0, max_random_moves=40):
+    """
+    Positions to compare the models on: a random prefix of a book line followed by random legal moves.
+    Only positions with a legal move are kept.
+    """
+    rand = random.Random(seed)
+    lines = list(read_pgn_lines(openings_file_path))
+    boards = []
+    while len(boards) < count:
+        board = Board()
+        line = rand.choice(lines)
+        for san in line[:rand.randint(0, len(line))]:
+            board.push(board.parse_san(san))
+        for _ in range(rand.randint(0, max_random_moves)):
+            moves = board.legal_moves()
+            if not moves:
+                break
+            board.push(rand.choice(moves))
+        if board.legal_moves():
+            boards.append(board)
+    return boards
+
+def read_positions(fen_file):
+    """
+    The positions of a file with one FEN per line. Positions without a legal move are left out, there is no move to agree on.
+    """
+    with open(fen_file) as f:
+        boards = [Board(line.strip()) for line in f if line.strip()]
+    return [board for board in boards if board.legal_moves()]
+
+def agreement(reference, candidate, boards, batch_size=64):
+    """
+    Top-1 and top-3 agreement of candidate with reference: the share of positions where the best move of
+    reference is the best move of candidate, and where it is one of the 3 best moves of candidate.
+    Positions without a legal move are skipped and not counted.
+    """
+    top1 = top3 = compared = 0
+    for start in range(0, len(boards), batch_size):
+        batch = BoardBatch.from_boards(boards[start:start + batch_size])
+        board_input = boards_to_input(batch)
+        with torch.no_grad():
+            expected = decode_policies(reference(board_input), batch, 1)
+            actual = decode_policies(candidate(board_input), batch, 3)
+        for best, top in zip(expected, actual):
+            if not best:
+                continue
+            compared += 1
+            moves = [move for move, _ in top]
+            top1 += moves[0] == best[0][0]
+            top3 += best[0][0] in moves
+    if not compared:
+        raise ValueError("No positions with a legal move to compare")
+    return top1 / compared, top3 / compared
+
+def latency(model, boards, batch_size, repeats=20):
+    """
+    Median milliseconds of a forward pass over batch_size positions.
+    """
+    board_input = boards_to_input(boards[:batch_size])
+    times = []
+    with torch.no_grad():
+        model(board_input)
+        for _ in range(repeats):
+            start = time.perf_counter()
+            model(board_input)
+            times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+def weights_size(model):
+    """
+    Bytes of the saved weights of the model.
+    """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the int8 quantized engine model with the float one")
+    parser.add_argument('--checkpoint', default=model_file_path, help="model weights to compare (the served model by default)")
+    parser.add_argument('--fens', help="file with one FEN per line to compare on, held out from training. "
+                                       "By default positions are sampled from the book and random play")
+    parser.add_argument('-n', '--positions', type=int, default=2000, help="number of positions to sample")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-top1', type=float, default=0.95, help="lowest top-1 agreement that passes")
+    parser.add_argument('--min-top3', type=float, default=0.99, help="lowest top-3 agreement that passes")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 32], help="batch sizes to time")
+    args = parser.parse_args(argv)
+
+    model = ChessNet()
+    model.load_state_dict(torch.load(args.checkpoint, map_location='cpu'))
+    model.eval()
+    quantized = quantize_model(model)
+    boards = read_positions(args.fens) if args.fens else sample_positions(args.positions, args.seed)
+
+    top1, top3 = agreement(model, quantized, boards)
+    print(f"Agreement over {len(boards)} positions: top-1 {top1:.2%} (min {args.min_top1:.2%}), "
+          f"top-3 {top3:.2%} (min {args.min_top3:.2%})")
+    for batch_size in args.batch_sizes:
+        print(f"Batch {batch_size:>3}: float {latency(model, boards, batch_size):8.2f} ms, "
+              f"int8 {latency(quantized, boards, batch_size):8.2f} ms")
+    print(f"Weights: float {weights_size(model) / 2**20:.1f} MiB, int8 {weights_size(quantized) / 2**20:.1f} MiB")
+
+    passed = top1 >= args.min_top1 and top3 >= args.min_top3
+    print("PASS" if passed else "FAIL")
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,28 @@
+""""""""""""""""""
+"    ZOBRIST     "
+""""""""""""""""""
+# Random 64-bit keys for Zobrist hashing. The key of a position is the xor of the keys of every
+# piece on its square, of the castling rights, of the en passant file and of the side to move,
+# so a move only has to xor out what changed and xor in the new state.
+# The generator is seeded so every process (and anything saved to disk) agrees on the keys.
+import random
+
+_random = random.Random(20241018)
+
+# PIECE_KEYS[color][piece id][square]
+PIECE_KEYS = {color: [[_random.getrandbits(64) for _ in range(64)] for _ in range(7)]
+              for color in ('white', 'black')}
+
+# One key per castling bit, CASTLING_KEYS[rights] is the xor of the keys of the bits set in rights
+_castling_bit_keys = [_random.getrandbits(64) for _ in range(4)]
+CASTLING_KEYS = [0] * 16
+for rights in range(16):
+    for bit in range(4):
+        if rights & (1 << bit):
+            CASTLING_KEYS[rights] ^= _castling_bit_keys[bit]
+
+# Indexed by the file of the en passant target
+EN_PASSANT_KEYS = [_random.getrandbits(64) for _ in range(8)]
+
+# Xored in when black is to move
+TURN_KEY = _random.getrandbits(64)
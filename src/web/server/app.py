@@ -1,9 +1,15 @@
+import os
 from routes import *
 from flask_cors import CORS
+from chessGame import warm_up
 CORS(app)
 
 #Run application
 if __name__ == '__main__': 
     with app.app_context():
         db.create_all()   
+    # The reloader of debug mode runs this twice, warm up in the process serving the requests only.
+    # Under gunicorn the workers warm up in post_fork (gunicorn.conf.py)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        print(warm_up())
     app.run(debug=True, port = 5001)
@@ -8,15 +8,21 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')
 # Now you can import modules from chessGame
 from chessGame import Engine
 from chessGame import Board
-from chessGame import ChessNet
-import torch
+from chessGame import get_scheduler, get_cache
+from chessGame.move import move_from_uci, move_to_uci, encode_move, move_from_square, move_to_square, move_promotion, PROMOTION_IDS
+# The model is loaded on the first engine move, call chessGame.warm_up() to load it before serving.
+# Engine moves of concurrent games share forward passes through the scheduler (the Procfile runs
+# threaded workers, so one worker serves several games at once) and positions
+# other games already reached are answered from the prediction cache.
 
-model_folder_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'model'))
-model_file_path = os.path.join(model_folder_path, 'savedModels/updated_again_model_current.pth')
-
-model = ChessNet()
-model.load_state_dict(torch.load(model_file_path))
-model.eval()
+def game_status_of(board):
+    """
+    'ongoing', or how the game ended ('checkmate', 'stalemate', 'fifty_moves', 'threefold_repetition').
+    The board is rebuilt from the stored FEN on every request, so repetitions are only seen
+    within the moves played on it, the other endings are always caught.
+    """
+    outcome = board.outcome()
+    return outcome[0] if outcome else 'ongoing'
 
 @app.route('/new_game/<player>', methods=['POST'])
 def new_game(player):
@@ -46,23 +52,21 @@ def make_move(game_id):
     print(engine.color)
     
     # Apply the move to the engine
-    engine_move = engine.engine_move(board, model)
-    print(engine_move)
-    if not engine_move:
+    engine_move = engine.engine_move(board, scheduler=get_scheduler(), cache=get_cache())
+    if engine_move is None:
         return jsonify({"status": "error", "message": "No valid moves found"}), 400
-    engine_m, move = engine_move
-    move = move.uci()
-    engine_start_pos, engine_end_pos = engine_m
-    print(engine_start_pos, engine_end_pos)
-    next_move = engine.update((engine_start_pos, engine_end_pos), board, True)
-    if board.move_piece(engine_start_pos, engine_end_pos, None):
+    move = move_to_uci(engine_move)
+    print(move)
+    next_move = engine.update(engine_move, board, True)
+    if board.play(engine_move):
         game.fen = board.generate_fen()
+        game.game_status = game_status_of(board)
         next_move = engine.played_moves[-1] if engine.opening_phase else next_move
         game.moves = (game.moves or '') + next_move + " "  # Update move history
         game.opening_phase = engine.opening_phase
         db.session.commit()
 
-        return jsonify({"status": "success", "fen": game.fen, "next_move": move})
+        return jsonify({"status": "success", "fen": game.fen, "next_move": move, "game_status": game.game_status})
     else:
         return jsonify({"status": "error", "message": "Invalid move"}), 400
     
@@ -80,20 +84,29 @@ def move(game_id):
     move_data = move.get('move', {})
     from_square = move_data.get('from')  # E.g., 'e2'
     to_square = move_data.get('to')
-    print(from_square, to_square)
-    start_pos, end_pos = board.algebraic_to_index(from_square), board.algebraic_to_index(to_square)
-    start_pos = (7-start_pos[0], start_pos[1])
-    end_pos = (7-end_pos[0], end_pos[1])
-    tmp_engine = Engine()
-    print(start_pos, end_pos)
-    update = tmp_engine.update((start_pos, end_pos), board, actual=True)
-    if board.move_piece(start_pos, end_pos, None):
+    promotion = move_data.get('promotion') or ''  # E.g., 'q', only sent for promotions
+    print(from_square, to_square, promotion)
+    try:
+        player_move = move_from_uci(f"{from_square}{to_square}{promotion}")
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid move"}), 400
+    # A pawn reaching the last rank without a promotion piece promotes to a queen
+    from_sq, to_sq = move_from_square(player_move), move_to_square(player_move)
+    piece = board.squares[from_sq]
+    if piece and piece.piece_type == 'pawn' and to_sq // 8 in (0, 7) and not move_promotion(player_move):
+        player_move = encode_move(from_sq, to_sq, PROMOTION_IDS['queen'])
+    tmp_engine = Engine(played_moves=[])
+    # The engine records the move in SAN once it is known to be legal, before it is played.
+    # A promotion still pending afterwards would store a pawn on the last rank, so it is refused
+    if board.play(player_move, tmp_engine) and not board.promotion:
+        update = tmp_engine.played_moves[-1]
         game.fen = board.generate_fen()
+        game.game_status = game_status_of(board)
         game.moves = (game.moves or '') + update + " " # Update move history
         del tmp_engine
         db.session.commit()
 
-        return jsonify({"status": "success", "fen": game.fen})
+        return jsonify({"status": "success", "fen": game.fen, "game_status": game.game_status})
     else:
         return jsonify({"status": "error", "message": "Invalid move"}), 400
 